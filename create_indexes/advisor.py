@@ -0,0 +1,199 @@
+import sys
+import json
+from datetime import datetime
+from pathlib import Path
+from pymongo import MongoClient
+import yaml
+
+# The project's query pipelines and explain helpers live in run_queries
+sys.path.append(str(Path(__file__).resolve().parent.parent / "run_queries"))
+import queries
+import benchmark
+
+# Operators that make a field a range (not an equality) predicate
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$in", "$nin", "$regex", "$all"}
+GEO_OPERATORS = {"$geoWithin", "$geoIntersects", "$near", "$nearSphere"}
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def query_cases(db) -> list:
+    """
+    The project's queries as explainable cases (see run_queries/queries.py).
+    """
+    time_start = datetime.strptime("2017-11-06T08:00:00.000+00:00", "%Y-%m-%dT%H:%M:%S.%f%z")
+    time_end = datetime.strptime("2017-11-06T08:59:59.000+00:00", "%Y-%m-%dT%H:%M:%S.%f%z")
+    cases = [
+        {"query": "query2", "collection": "vessels_collection", "pipeline": queries.query2_pipeline()},
+        {"query": "query3a", "collection": "dynamic_collection", "pipeline": queries.query3a_pipeline()},
+        {"query": "query3b", "collection": "dynamic_collection", "pipeline": queries.query3b_pipeline()},
+        {"query": "query4", "collection": "dynamic_collection", "filter": queries.query4_filter(time_start, time_end),
+         "projection": {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}},
+        {"query": "islands", "collection": "geodata_collection", "filter": {"loc_type": "island", "fid": 1}},
+    ]
+    centroid_coords = queries.island_centroid(db, 1)
+    if centroid_coords:
+        cases.append({"query": "query3c", "collection": "dynamic_collection",
+                      "pipeline": queries.query3c_pipeline(centroid_coords)})
+    return cases
+
+def explain_case(db, case) -> dict:
+    collection = db[case["collection"]]
+    if "pipeline" in case:
+        return benchmark.explain_aggregate(db, collection, case["pipeline"])
+    return benchmark.explain_find(db, collection, case["filter"], case.get("projection"))
+
+def case_filter(case) -> dict:
+    """
+    The filter a case applies first: the find filter, or the first $match of the pipeline.
+    """
+    if "filter" in case:
+        return case["filter"]
+    first = case["pipeline"][0]
+    return first.get("$match", {})
+
+def sort_fields(case) -> list:
+    """
+    Fields of the first $sort stage of a pipeline case, as (field, direction).
+    """
+    for stage in case.get("pipeline", []):
+        if "$sort" in stage:
+            return list(stage["$sort"].items())
+    return []
+
+def blocking_sorts(explain) -> int:
+    """
+    Number of $sort stages an aggregation runs in memory (not absorbed into the index scan).
+    """
+    return sum(1 for stage in explain.get("stages", []) if "$sort" in stage)
+
+def classify_fields(filter) -> dict:
+    """
+    Split the fields of a filter into equality, range and geo predicates.
+    """
+    fields = {"equality": [], "range": [], "geo": []}
+    for field, condition in filter.items():
+        if field in ("$and", "$or"):
+            for clause in condition:
+                for kind, names in classify_fields(clause).items():
+                    fields[kind].extend(name for name in names if name not in fields[kind])
+            continue
+        if field.startswith("$"):
+            continue
+        operators = set(condition) if isinstance(condition, dict) else set()
+        if operators & GEO_OPERATORS:
+            fields["geo"].append(field)
+        elif operators & RANGE_OPERATORS:
+            fields["range"].append(field)
+        else:
+            fields["equality"].append(field)
+    return fields
+
+def findings(summary) -> list:
+    """
+    Problems visible in an execution summary (benchmark.execution_summary).
+    """
+    problems = []
+    if "COLLSCAN" in summary["stages"]:
+        problems.append("COLLSCAN")
+    if "SORT" in summary["stages"] or summary.get("blockingSorts"):
+        problems.append("in-memory SORT")
+    returned = max(summary["nReturned"], 1)
+    ratio = summary["totalDocsExamined"] / returned
+    if ratio > 10:
+        problems.append(f"docsExamined/nReturned = {ratio:.1f}")
+    return problems
+
+def candidate_indexes(case, summary, existing_keys) -> list:
+    """
+    Propose indexes for a case: equality fields, then sort fields, then range fields
+    (equality-sort-range), or a 2dsphere index for geo predicates.
+    Indexes whose key pattern already exists are skipped.
+    """
+    if not findings(summary):
+        return []
+    fields = classify_fields(case_filter(case))
+    candidates = []
+    for field in fields["geo"]:
+        candidates.append([(field, "2dsphere")])
+    keys = [(field, 1) for field in fields["equality"]] + sort_fields(case)
+    keys += [(field, 1) for field in fields["range"] if field not in dict(keys)]
+    if keys:
+        candidates.append(keys)
+    return [keys for keys in candidates if tuple(keys) not in existing_keys]
+
+def copy_to_scratch(db, scratch_db, collection_name, sample_size):
+    """
+    Copy a random sample of a collection and its current indexes into the scratch database.
+    Indexes keep their options (2dsphere version, partial filter, sparse, unique, collation, ...)
+    so the "before" plans match production.
+    """
+    scratch_db[collection_name].drop()
+    db[collection_name].aggregate([{"$sample": {"size": sample_size}},
+                                   {"$out": {"db": scratch_db.name, "coll": collection_name}}])
+    for name, info in db[collection_name].index_information().items():
+        if name != "_id_":
+            options = {key: value for key, value in info.items() if key not in ("key", "v", "ns")}
+            scratch_db[collection_name].create_index(info["key"], name=name, **options)
+
+def measure(db, case) -> dict:
+    explain = explain_case(db, case)
+    summary = benchmark.execution_summary(explain)
+    summary["blockingSorts"] = blocking_sorts(explain)
+    summary["findings"] = findings(summary)
+    return summary
+
+def advise(db, scratch_db=None, sample_size=100000) -> list:
+    """
+    Explain every query, flag problems, propose indexes and (with scratch_db) measure them.
+
+    Returns:
+        List[dict]: One report entry per query.
+    """
+    report = []
+    copied = set()
+    for case in query_cases(db):
+        collection_name = case["collection"]
+        existing_keys = {tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                               for field, direction in info["key"]) for info in db[collection_name].index_information().values()}
+        summary = measure(db, case)
+        entry = {"query": case["query"], "collection": collection_name, "current": summary,
+                 "candidates": candidate_indexes(case, summary, existing_keys)}
+        print(f"{case['query']}: stages {summary['stages']}, findings {summary['findings'] or 'none'}")
+
+        if scratch_db is not None and entry["candidates"]:
+            if collection_name not in copied:
+                copy_to_scratch(db, scratch_db, collection_name, sample_size)
+                copied.add(collection_name)
+            entry["before"] = measure(scratch_db, case)
+            entry["after"] = []
+            for keys in entry["candidates"]:
+                name = scratch_db[collection_name].create_index(keys)
+                after = measure(scratch_db, case)
+                after["index"] = keys
+                entry["after"].append(after)
+                scratch_db[collection_name].drop_index(name)
+                print(f"  candidate {keys}: docs examined {entry['before']['totalDocsExamined']} -> "
+                      f"{after['totalDocsExamined']}, time {entry['before']['executionTimeMillis']} -> "
+                      f"{after['executionTimeMillis']} ms")
+        report.append(entry)
+    return report
+
+def main(config_path="load_database/index_config.yaml"):
+    config = load_config(config_path)
+    client = MongoClient(config["mongo_uri"])
+    db = client[config["database"]]
+    scratch_db = client[config["database"] + "_scratch"]
+
+    report = advise(db, scratch_db)
+    client.drop_database(scratch_db.name)
+    client.close()
+
+    output_path = "create_indexes/advisor_report.json"
+    with open(output_path, "w") as file:
+        json.dump(report, file, indent=4, default=str)
+    print(f"Advisor report written to {output_path}")
+
+if __name__ == "__main__":
+    main()
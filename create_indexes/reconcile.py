@@ -0,0 +1,203 @@
+import sys
+import time
+import threading
+from fnmatch import fnmatch
+import yaml
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+# Index options that change what an index does; anything else reported by index_information() is ignored
+SPEC_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "collation")
+
+# Collections being rebuilt by load_database/fastLoad.py ('<collection>_staging'); glob specs skip them
+STAGING_SUFFIX = "_staging"
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def normalize_keys(keys) -> tuple:
+    """
+    Key pattern as a tuple of (field, direction); numeric directions as int (the server may report 1.0).
+    """
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in keys)
+
+def index_options(info: dict) -> dict:
+    options = {key: info[key] for key in SPEC_OPTIONS if key in info}
+    if "collation" in options:
+        # The server expands collations with defaults; compare on the locale only
+        options["collation"] = {"locale": options["collation"].get("locale")}
+    return options
+
+def default_name(keys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def desired_indexes(specs) -> list:
+    """
+    Normalize the YAML specs of one collection to dicts with keys, name and options.
+    """
+    indexes = []
+    for spec in specs or []:
+        keys = normalize_keys(spec["keys"])
+        options = dict(spec.get("options", {}))
+        name = options.pop("name", None) or default_name(keys)
+        indexes.append({"keys": keys, "name": name, "options": index_options(options)})
+    return indexes
+
+def existing_indexes(collection) -> list:
+    return [{"keys": normalize_keys(info["key"]), "name": name, "options": index_options(info)}
+            for name, info in collection.index_information().items() if name != "_id_"]
+
+def shard_key(collection) -> tuple:
+    """
+    Fields of the collection's shard key (config.collections), empty when it is not sharded.
+    """
+    try:
+        info = collection.database.client.config.collections.find_one({"_id": collection.full_name})
+    except OperationFailure:
+        return ()
+    if not info or info.get("dropped"):
+        return ()
+    return tuple(info["key"])
+
+def plan(collection, specs) -> dict:
+    """
+    Diff the desired indexes against the collection's current indexes.
+
+    Returns:
+        dict: 'create' (missing indexes), 'drop' (obsolete indexes, dropped after the creates succeed),
+        'conflict' (same key pattern but different options: these cannot coexist with the
+        obsolete index, so they are only rebuilt with allow_rebuild) and 'shard_key' (indexes
+        outside the spec that are kept because they are prefixed by the shard key, which the
+        server refuses to drop).
+    """
+    desired = desired_indexes(specs)
+    existing = existing_indexes(collection)
+    matches = lambda a, b: a["keys"] == b["keys"] and a["options"] == b["options"]
+    key_fields = shard_key(collection)
+    # Any index prefixed by the shard key fields may be the one the cluster relies on
+    backs_shard_key = lambda index: bool(key_fields) and tuple(field for field, _ in index["keys"])[:len(key_fields)] == key_fields
+
+    create = [index for index in desired if not any(matches(index, current) for current in existing)]
+    drop = [current for current in existing if not any(matches(index, current) for index in desired)]
+    kept = [current for current in drop if backs_shard_key(current)]
+    drop = [current for current in drop if current not in kept]
+    conflict = [(index, current) for index in create for current in drop
+                if index["keys"] == current["keys"] or index["name"] == current["name"]]
+    conflicting_creates = [index for index, _ in conflict]
+    conflicting_drops = [current for _, current in conflict]
+    return {
+        "create": [index for index in create if index not in conflicting_creates],
+        "drop": [current for current in drop if current not in conflicting_drops],
+        "conflict": conflict,
+        "shard_key": kept,
+    }
+
+def report_progress(db, collection_name, stop, interval_s=5):
+    """
+    Print the progress of running index builds on a collection until stop is set.
+    """
+    while not stop.wait(interval_s):
+        try:
+            operations = db.client.admin.aggregate([
+                {"$currentOp": {"allUsers": True, "idleConnections": False}},
+                {"$match": {"ns": f"{db.name}.{collection_name}", "command.createIndexes": {"$exists": True}}},
+            ])
+            for operation in operations:
+                progress = operation.get("progress", {})
+                done, total = progress.get("done"), progress.get("total")
+                percent = f" ({100 * done / total:.1f}%)" if done is not None and total else ""
+                print(f"  [{collection_name}] {operation.get('msg', 'building index')}{percent}")
+        except OperationFailure as e:
+            print(f"  Cannot read build progress: {e}")
+            return
+
+def build_index(db, collection_name, index, interval_s=5):
+    """
+    Build one index (online: reads and writes continue during the build) while reporting progress.
+    """
+    stop = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(db, collection_name, stop, interval_s), daemon=True)
+    reporter.start()
+    start = time.time()
+    try:
+        db[collection_name].create_index(list(index["keys"]), name=index["name"], **index["options"])
+    finally:
+        stop.set()
+        reporter.join()
+    print(f"Created index {index['name']} on {collection_name} in {time.time() - start:.2f} seconds")
+
+def expand_patterns(db, collections: dict) -> dict:
+    """
+    Apply specs keyed by a glob pattern (e.g. 'dynamic_collection_*' for the month partitions)
+    to every existing collection matching it; an exact name takes precedence over a pattern.
+    Staging collections of a fast reload are never matched: fastLoad.py builds their indexes itself.
+    """
+    expanded = {name: specs for name, specs in collections.items() if "*" not in name}
+    patterns = {name: specs for name, specs in collections.items() if "*" in name}
+    for collection_name in sorted(db.list_collection_names()):
+        for pattern, specs in patterns.items():
+            if collection_name in expanded or STAGING_SUFFIX in collection_name:
+                continue
+            if fnmatch(collection_name, pattern):
+                expanded[collection_name] = specs
+    return expanded
+
+def reconcile(db, collections: dict, dry_run=False, allow_rebuild=False, interval_s=5) -> dict:
+    """
+    Bring the indexes of every collection in line with the spec without dropping anything
+    that queries rely on before its replacement exists.
+
+    Returns:
+        dict: Plan per collection.
+    """
+    plans = {}
+    for collection_name, specs in expand_patterns(db, collections).items():
+        collection_plan = plan(db[collection_name], specs)
+        plans[collection_name] = collection_plan
+
+        for index in collection_plan["create"]:
+            print(f"[{collection_name}] create {index['name']} {list(index['keys'])} {index['options'] or ''}")
+        for current in collection_plan["drop"]:
+            print(f"[{collection_name}] drop {current['name']} (not in spec)")
+        for current in collection_plan["shard_key"]:
+            print(f"[{collection_name}] keep {current['name']} (not in spec, backs the shard key)")
+        for index, current in collection_plan["conflict"]:
+            action = "rebuild" if allow_rebuild else "skip (needs allow_rebuild)"
+            print(f"[{collection_name}] {action}: {current['name']} -> {index['name']} {index['options'] or ''}")
+
+        if dry_run:
+            continue
+
+        # 1. Build everything that is missing
+        for index in collection_plan["create"]:
+            build_index(db, collection_name, index, interval_s)
+
+        # 2. Drop obsolete indexes only now that their replacements are built
+        for current in collection_plan["drop"]:
+            try:
+                db[collection_name].drop_index(current["name"])
+            except OperationFailure as e:
+                # Keep going: the other collections still need reconciling
+                print(f"Cannot drop index {current['name']} on {collection_name}: {e}")
+                continue
+            print(f"Dropped index {current['name']} on {collection_name}")
+
+        # 3. Indexes that cannot coexist with their old version are replaced drop-then-build
+        if allow_rebuild:
+            for index, current in collection_plan["conflict"]:
+                db[collection_name].drop_index(current["name"])
+                build_index(db, collection_name, index, interval_s)
+
+    return plans
+
+def main(config_path="load_database/index_config.yaml", dry_run=False):
+    config = load_config(config_path)
+    client = MongoClient(config["mongo_uri"])
+    db = client[config["database"]]
+    reconcile(db, config["collections"], dry_run=dry_run, interval_s=config.get("progress_interval_s", 5))
+    client.close()
+
+if __name__ == "__main__":
+    main(dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6371008.8
+KNOTS_PER_M_S = 1.943844
+SPEED_NOT_AVAILABLE = 102.3         # AIS speed over ground value meaning "not available"
+
+# Defaults of the 'cleaning' section of dynamic_config.yaml
+DEFAULTS = {
+    "enabled": True,
+    "dedup": True,
+    "lon_range": [-180.0, 180.0],
+    "lat_range": [-90.0, 90.0],
+    "max_reported_speed": 102.2,      # knots; 102.3 ("not available") becomes a missing speed
+    "max_implied_speed": 60.0,        # knots between two consecutive fixes of a vessel
+    "min_jump_m": 500.0,              # GPS jitter below this distance is never an outlier
+    "passes": 3,                      # outlier passes (removing a spike changes its neighbours)
+}
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+def haversine_m(lon1, lat1, lon2, lat2) -> np.ndarray:
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def range_mask(df: pd.DataFrame, options: dict) -> np.ndarray:
+    """
+    Rows with finite coordinates inside the configured ranges and a plausible (or missing) speed.
+    """
+    lon, lat = df["lon"].to_numpy(dtype=float), df["lat"].to_numpy(dtype=float)
+    speed = df["speed"].to_numpy(dtype=float)
+    keep = np.isfinite(lon) & np.isfinite(lat)
+    keep &= (lon >= options["lon_range"][0]) & (lon <= options["lon_range"][1])
+    keep &= (lat >= options["lat_range"][0]) & (lat <= options["lat_range"][1])
+    keep &= np.isnan(speed) | ((speed >= 0) & (speed <= options["max_reported_speed"]))
+    return keep
+
+def duplicate_mask(vessel, t) -> np.ndarray:
+    """
+    Rows (sorted by vessel and time) repeating the previous row's vessel and timestamp:
+    exact duplicates and repeated fixes at the same t. The first fix is kept.
+    """
+    duplicate = np.zeros(len(t), dtype=bool)
+    duplicate[1:] = (vessel[1:] == vessel[:-1]) & (t[1:] == t[:-1])
+    return duplicate
+
+def spike_mask(vessel, t, lon, lat, options) -> np.ndarray:
+    """
+    Fixes whose implied speed is impossible both from the previous and to the next fix of the
+    same vessel (a jump out and back). A vessel's first or last fix only needs its one impossible
+    side, and only when its neighbour is not a spike itself and connects plausibly to the fix
+    beyond it; otherwise (e.g. a vessel with two fixes) the endpoint cannot be told from the spike.
+    """
+    same_vessel = vessel[1:] == vessel[:-1]
+    dt = (t[1:] - t[:-1]).astype(float) / 1000.0    # t in epoch ms
+    distance = haversine_m(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        knots = np.where(dt > 0, distance / dt, np.inf) * KNOTS_PER_M_S
+    # Impossible step between row i and row i + 1 (only within one vessel)
+    impossible = same_vessel & (distance > options["min_jump_m"]) & (knots > options["max_implied_speed"])
+
+    into = np.zeros(len(t), dtype=bool)
+    into[1:] = impossible
+    out_of = np.zeros(len(t), dtype=bool)
+    out_of[:-1] = impossible
+    has_previous = np.zeros(len(t), dtype=bool)
+    has_previous[1:] = same_vessel
+    has_next = np.zeros(len(t), dtype=bool)
+    has_next[:-1] = same_vessel
+    # A neighbour with a plausible step onwards is trusted; comparing against it flags the endpoint
+    trusted_next = np.zeros(len(t), dtype=bool)
+    trusted_next[:-1] = has_next[1:] & ~out_of[1:]
+    trusted_previous = np.zeros(len(t), dtype=bool)
+    trusted_previous[1:] = has_previous[:-1] & ~into[:-1]
+    first = out_of & ~has_previous & trusted_next
+    last = into & ~has_next & trusted_previous
+    return (into & out_of) | first | last
+
+def clean(df: pd.DataFrame, **options):
+    """
+    Remove invalid, duplicate and teleporting fixes from a parsed AIS dynamic frame.
+
+    Args:
+        df (pd.DataFrame): Frame with vessel_id, timestamp, lon, lat and speed (staging.load_dynamic).
+        **options: Overrides of DEFAULTS (the 'cleaning' section of the config).
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: Cleaned frame (sorted by vessel and time) and the rows and bytes removed.
+    """
+    options = {**DEFAULTS, **options}
+    report = {"rows_in": len(df), "bytes_in": frame_bytes(df)}
+    if not options["enabled"]:
+        return df, dict(report, rows_out=len(df), bytes_removed=0)
+
+    # "Not available" is a missing speed, not an invalid fix: keep the position
+    not_available = np.isclose(df["speed"].to_numpy(dtype=float), SPEED_NOT_AVAILABLE)
+    report["speed_not_available"] = int(not_available.sum())
+    if not_available.any():
+        df = df.assign(speed=df["speed"].mask(not_available))
+
+    keep = range_mask(df, options)
+    report["out_of_range"] = int((~keep).sum())
+    df = df[keep]
+
+    # Sort once by vessel and time: every later check compares neighbouring rows
+    vessel = pd.factorize(df["vessel_id"])[0]
+    t = df["timestamp"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    order = np.lexsort((t, vessel))
+    df, vessel, t = df.iloc[order], vessel[order], t[order]
+
+    if options["dedup"]:
+        duplicate = duplicate_mask(vessel, t)
+        report["duplicates"] = int(duplicate.sum())
+        df, vessel, t = df[~duplicate], vessel[~duplicate], t[~duplicate]
+
+    report["speed_outliers"] = 0
+    for _ in range(options["passes"]):
+        spikes = spike_mask(vessel, t, df["lon"].to_numpy(dtype=float), df["lat"].to_numpy(dtype=float), options)
+        if not spikes.any():
+            break
+        report["speed_outliers"] += int(spikes.sum())
+        df, vessel, t = df[~spikes], vessel[~spikes], t[~spikes]
+
+    df = df.reset_index(drop=True)
+    report["rows_out"] = len(df)
+    report["bytes_removed"] = report["bytes_in"] - frame_bytes(df)
+    return df, report
@@ -1,10 +1,18 @@
+import sys
+import numpy as np
 import pandas as pd
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 import yaml
 from typing import Dict, List
 from datetime import timedelta
 from bson import BSON
-import time
+import staging
+import instrumentation
+import generations
+import vesselLatest
+import aisCleaning
+import partitions
 
 # Load configuration
 def load_config(config_path: str) -> Dict:
@@ -13,7 +21,7 @@ def load_config(config_path: str) -> Dict:
 
 # Connect to MongoDB
 def connect_to_mongo(uri: str, database: str, collection: str):
-    client = MongoClient(uri)
+    client = MongoClient(uri, event_listeners=[instrumentation.command_listener()])
     db = client[database]
     return db[collection]
 
@@ -28,23 +36,97 @@ def insert_data_to_mongo(collection, data: List[Dict]):
     Args:
         collection (pymongo.collection.Collection): MongoDB collection.
         data (List[Dict]): List of data dictionaries to insert.
+
+    Returns:
+        int: Number of documents inserted (fewer than len(data) when the insert failed).
     """
     try:
-        result = collection.insert_many(data, ordered=False)  # Set ordered=False for better performance
+        with instrumentation.span("insert", collection=collection.name):
+            result = collection.insert_many(data, ordered=False)  # Set ordered=False for better performance
+            instrumentation.count("documents_inserted", len(result.inserted_ids))
         print(f"Inserted {len(result.inserted_ids)} documents.")
+        return len(result.inserted_ids)
     except Exception as e:
         print(f"An error occurred during insertion: {e}")
+        # An unordered bulk insert still reports how many documents made it
+        return e.details.get("nInserted", 0) if isinstance(e, BulkWriteError) else 0
+
+def insert_partitioned(collection, documents: List[Dict]):
+    """
+    Insert bucket documents into month partitions '<collection>_YYYY_MM' (see partitions.py),
+    each with its own indexes and registered in the partition catalog.
+    Returns the number of documents inserted.
+    """
+    db = collection.database
+    inserted = 0
+    for month, month_documents in partitions.split_by_month(documents).items():
+        partition = db[partitions.partition_name(collection.name, month)]
+        partitions.ensure_partition_indexes(partition)
+        month_inserted = insert_data_to_mongo(partition, month_documents)
+        partitions.register_partition(db, collection.name, month, month_inserted)
+        generations.bump_generation(db, partition.name)
+        inserted += month_inserted
+    return inserted
+
+def bucket_track(positions, previous_fix=None):
+    """
+    The bucket's path as a GeoJSON LineString in time order (2dsphere-indexed 'track' field),
+    starting at previous_fix when given, without repeated consecutive points;
+    None when the vessel did not move.
+    """
+    timestamps = np.array([position["timestamp"] for position in positions], dtype="datetime64[ms]")
+    coordinates = np.array([position["geometry"]["coordinates"][:2] for position in positions], dtype=float).reshape(-1, 2)
+    coordinates = coordinates[np.argsort(timestamps, kind="stable")]
+    if previous_fix is not None:
+        coordinates = np.vstack([previous_fix["coordinates"][:2], coordinates])
+    if len(coordinates) < 2:
+        return None
+    moved = np.ones(len(coordinates), dtype=bool)
+    moved[1:] = np.any(coordinates[1:] != coordinates[:-1], axis=1)
+    coordinates = coordinates[moved]
+    if len(coordinates) < 2:
+        return None
+    return {"type": "LineString", "coordinates": coordinates.tolist()}
+
+def link_previous_fixes(documents, previous_fixes=None):
+    """
+    Store on every bucket the last fix of the same vessel's previous hour (buckets are sorted by
+    vessel and hour), so its track also covers the movement between the two buckets.
+
+    Within one file the fix comes from the previous bucket. previous_fixes (vessel_id -> stored
+    latest fix, see vesselLatest.previous_fixes) links a vessel's first bucket to the files loaded
+    before, when that fix falls in the previous hour: it is then the last fix before the bucket.
+    """
+    for previous, doc in zip(documents, documents[1:]):
+        if previous["vessel_id"] == doc["vessel_id"] and doc["timestamp_start"] - previous["timestamp_start"] == timedelta(hours=1):
+            last = max(previous["positions"], key=lambda position: position["timestamp"])
+            doc["previous_fix"] = {"timestamp": last["timestamp"], "coordinates": last["geometry"]["coordinates"]}
+    for doc in documents:
+        fix = (previous_fixes or {}).get(doc["vessel_id"])
+        if "previous_fix" not in doc and fix and doc["timestamp_start"] - timedelta(hours=1) <= fix["timestamp"] < doc["timestamp_start"]:
+            doc["previous_fix"] = fix
+    return documents
+
+def with_track(doc):
+    track = bucket_track(doc["positions"], doc.get("previous_fix"))
+    if track is not None:
+        doc["track"] = track
+    return doc
 
 # Check and split large documents
 def split_large_documents(doc, max_doc_size=16 * 1024 * 1024):
     doc_size = len(BSON.encode(doc))
+    instrumentation.count("bson_bytes", doc_size)
     if doc_size > max_doc_size:
         positions = doc.pop('positions')
+        doc.pop('track', None)  # every chunk gets the track of its own positions
+        previous_fix = doc.pop('previous_fix', None)
         chunk_size = len(positions) // (doc_size // max_doc_size + 1)
-        return [dict(doc, **{
+        return [with_track(dict(doc, **{
             "_id": f"{doc['_id']}_chunk_{i // chunk_size}",
             "positions": positions[i:i + chunk_size],
-        }) for i in range(0, len(positions), chunk_size)]
+        }, **({"previous_fix": previous_fix} if i == 0 and previous_fix else {})))
+            for i in range(0, len(positions), chunk_size)]
     return [doc]
 
 # Create bucketed documents with fixed 1-hour buckets
@@ -81,7 +163,7 @@ def create_hourly_buckets_for(df, max_doc_size=16 * 1024 * 1024):
 
     return documents
 
-def create_hourly_buckets(df, max_doc_size=16 * 1024 * 1024):
+def create_hourly_buckets(df, max_doc_size=16 * 1024 * 1024, previous_fixes=None):
     # No need to convert timestamp again, it's already handled before passing to this function.
     
     # Define 1-hour buckets using 'h' instead of 'H'
@@ -108,50 +190,83 @@ def create_hourly_buckets(df, max_doc_size=16 * 1024 * 1024):
         ).tolist()
     }).tolist()
 
-    # Split large documents if necessary
-    documents = [doc for d in documents for doc in split_large_documents(d, max_doc_size)]
+    # Split large documents if necessary (the track is included in the size check)
+    with instrumentation.span("encode"):
+        documents = [doc for d in link_previous_fixes(documents, previous_fixes) for doc in split_large_documents(with_track(d), max_doc_size)]
+        instrumentation.count("documents", len(documents))
     return documents
 
 # Main execution
-def main():
-
-    start_time = time.time()  # Start the timer
+def main(config_path="load_database/dynamic_config.yaml", collection_name=None) -> Dict:
+    """
+    Load every configured file. Failures are printed and also returned (documents built,
+    documents inserted and failed files), so callers such as fastLoad.py can refuse a partial load.
+    """
 
-    # Load configuration
-    config = load_config("load_database/dynamic_config.yaml")
+    # Load configuration (collection_name overrides the target collection, e.g. for fastLoad.py)
+    config = load_config(config_path)
+    config["collection"] = collection_name or config["collection"]
+    instrumentation.configure(config.get("trace_path"))
     collection = connect_to_mongo(config["mongo_uri"], config["database"], config["collection"])
-    
-    # Iterate over all files in the configuration
-    for file_entry in config["files"]:
-        file_path = file_entry["file_path"]
-        print(f"Processing file: {file_path}")
-        try:
-            # Load raw data
-            dynamic_df = load_data(file_path)
-            # dynamic_df['timestamp'] = pd.to_datetime(dynamic_df['t'], unit='ms')
-            if 't' in dynamic_df.columns:
-                dynamic_df['timestamp'] = pd.to_datetime(dynamic_df['t'], unit='ms')
-            elif 'timestamp' in dynamic_df.columns:
-                dynamic_df['timestamp'] = pd.to_datetime(dynamic_df['timestamp'], unit='ms')
-            else:
-                raise ValueError("Neither 't' nor 'timestamp' column found in the dataset.")
 
-            # Create documents with fixed 1-hour buckets
-            documents = create_hourly_buckets(dynamic_df)
+    result = {"documents": 0, "inserted": 0, "failed_files": []}
+    with instrumentation.span("load_dynamic") as total:
+        # Iterate over all files in the configuration
+        for file_entry in config["files"]:
+            file_path = file_entry["file_path"]
+            print(f"Processing file: {file_path}")
+            try:
+                with instrumentation.span("file", file=file_path):
+                    # Load typed data (from the staging cache when the file was parsed before)
+                    with instrumentation.span("parse"):
+                        dynamic_df = staging.load_dynamic(file_path, config.get("staging_dir"))
+                        instrumentation.count("rows", len(dynamic_df))
+
+                    # Drop invalid, duplicate and teleporting fixes before bucketing
+                    with instrumentation.span("clean"):
+                        dynamic_df, report = aisCleaning.clean(dynamic_df, **config.get("cleaning", {}))
+                        instrumentation.count("rows_removed", report["rows_in"] - report["rows_out"])
+                        instrumentation.count("bytes_removed", report["bytes_removed"])
+                    print(f"Cleaning removed {report['rows_in'] - report['rows_out']} of {report['rows_in']} rows "
+                          f"({report['bytes_removed'] / 1e6:.1f} MB): {report.get('out_of_range', 0)} out of range, "
+                          f"{report.get('duplicates', 0)} duplicates, {report.get('speed_outliers', 0)} speed outliers; "
+                          f"{report.get('speed_not_available', 0)} speeds not available")
+
+                    # Create documents with fixed 1-hour buckets, linked to the fixes of earlier files
+                    latest = collection.database[config.get("latest_collection", vesselLatest.COLLECTION)]
+                    with instrumentation.span("bucket"):
+                        previous_fixes = vesselLatest.previous_fixes(latest, dynamic_df["vessel_id"].unique().tolist())
+                        documents = create_hourly_buckets(dynamic_df, previous_fixes=previous_fixes)
+
+                    # Insert documents into MongoDB (one collection per month when partitioned)
+                    result["documents"] += len(documents)
+                    if config.get("partition_by_month"):
+                        inserted = insert_partitioned(collection, documents)
+                    else:
+                        inserted = insert_data_to_mongo(collection, documents)
+                    result["inserted"] += inserted
+                    if inserted < len(documents):
+                        result["failed_files"].append(file_path)
+
+                    # Keep the latest fix of every vessel current
+                    vesselLatest.update_latest(latest, dynamic_df)
 
-            # Insert documents into MongoDB
-            insert_data_to_mongo(collection, documents)
+                # New data: invalidate cached query results
+                generations.bump_generation(collection.database, collection.name)
+                generations.bump_generation(latest.database, latest.name)
 
-            print(f"Successfully processed and inserted data from {file_path}")
+                print(f"Successfully processed and inserted data from {file_path}")
 
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+            except Exception as e:
+                print(f"Error processing file {file_path}: {e}")
+                if file_path not in result["failed_files"]:
+                    result["failed_files"].append(file_path)
 
-    end_time = time.time()  # End the timer 12.06
-    print(f"Total Execution Time: {end_time - start_time:.2f} seconds")  # Print elapsed time
+    print(f"Total Execution Time: {total['duration_ms'] / 1000:.2f} seconds")  # Print elapsed time
+    return result
 
 
 if __name__ == "__main__":
-    main()
+    main(*sys.argv[1:])  # optional config path, e.g. the one written by syntheticGenerator.py
 # Execution Time: 1155.21 seconds with apply. 
 
@@ -0,0 +1,100 @@
+import sys
+from pathlib import Path
+from pymongo import MongoClient, IndexModel
+import yaml
+import instrumentation
+import generations
+import dynamicParser
+import geodataParser
+import vesselsParser
+import weatherParser
+
+# Index spec helpers are shared with the index reconciler
+sys.path.append(str(Path(__file__).resolve().parent.parent / "create_indexes"))
+import reconcile
+
+# Loader module and default config of every dataset
+LOADERS = {
+    "dynamic": (dynamicParser, "load_database/dynamic_config.yaml"),
+    "geodata": (geodataParser, "load_database/geo_config.yaml"),
+    "vessels": (vesselsParser, "load_database/vessel_config.yaml"),
+    "weather": (weatherParser, "load_database/weather_config.yaml"),
+}
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def recorded_indexes(db, collection_name, index_config_path="load_database/index_config.yaml") -> list:
+    """
+    Secondary indexes to rebuild after the load: those of the live collection,
+    or the declared spec when the collection does not exist yet.
+    """
+    if collection_name in db.list_collection_names():
+        indexes = reconcile.existing_indexes(db[collection_name])
+        if indexes:
+            return indexes
+    specs = load_config(index_config_path)["collections"].get(collection_name)
+    return reconcile.desired_indexes(specs)
+
+def index_models(indexes) -> list:
+    return [IndexModel(list(index["keys"]), name=index["name"], **index["options"]) for index in indexes]
+
+def fast_load(dataset, config_path=None, index_config_path="load_database/index_config.yaml"):
+    """
+    Full rebuild of one collection: load into an index-free '<collection>_staging' collection,
+    build all secondary indexes once in bulk, then rename the staging collection over the live one.
+    Readers keep seeing the old collection until the (atomic) rename, which only happens when
+    every file and insert batch of the load succeeded.
+
+    Only the main collection is staged. Side collections written by the loaders go live during
+    the load: vessel_latest (dynamic) and geodata_tiles (geodata). Month partitions
+    (partition_by_month) cannot be swapped as one collection and are refused.
+    """
+    loader, default_config_path = LOADERS[dataset]
+    config_path = config_path or default_config_path
+    config = load_config(config_path)
+    if config.get("partition_by_month"):
+        raise ValueError(f"{config_path}: fast reloads do not support partition_by_month; use the regular loader")
+    client = MongoClient(config["mongo_uri"])
+    db = client[config["database"]]
+    live_name = config["collection"]
+    staging_name = f"{live_name}_staging"
+
+    indexes = recorded_indexes(db, live_name, index_config_path)
+    print(f"Recorded {len(indexes)} indexes of {live_name}: {[index['name'] for index in indexes]}")
+
+    # Leftovers of an interrupted run would be loaded twice
+    db[staging_name].drop()
+
+    # Run the regular loader against the staging collection (no indexes to maintain per insert)
+    result = loader.main(config_path, staging_name)
+
+    with instrumentation.span("fast_load", collection=live_name) as total:
+        # Swap only a complete load: no failed file or batch, and every built document in staging
+        documents = db[staging_name].count_documents({})
+        if result["failed_files"] or documents == 0 or documents != result["documents"]:
+            client.close()
+            raise RuntimeError(f"Incomplete load into {staging_name} ({documents} of {result['documents']} documents, "
+                               f"failed files: {result['failed_files']}); {live_name} left untouched")
+
+        # One createIndexes command: all indexes are built in a single scan of the collection
+        with instrumentation.span("build_indexes"):
+            if indexes:
+                db[staging_name].create_indexes(index_models(indexes))
+
+        with instrumentation.span("swap"):
+            db[staging_name].rename(live_name, dropTarget=True)
+
+    # The live collection changed: invalidate cached query results
+    generations.bump_generation(db, live_name)
+    client.close()
+    print(f"Swapped {documents} documents into {live_name}; "
+          f"indexes built and renamed in {total['duration_ms'] / 1000:.2f} seconds")
+
+def main(datasets):
+    for dataset in datasets or LOADERS:
+        fast_load(dataset)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])  # e.g. python load_database/fastLoad.py dynamic weather
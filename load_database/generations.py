@@ -0,0 +1,22 @@
+# Ingestion generation counters: the loaders bump the counter of a collection after writing to it,
+# so caches of query results can tell whether the data they were computed from has changed.
+
+META_COLLECTION = "ingest_meta"
+
+def bump_generation(db, collection_name: str) -> int:
+    """
+    Increment the ingestion generation of a collection and return the new value.
+    """
+    result = db[META_COLLECTION].find_one_and_update(
+        {"_id": collection_name},
+        {"$inc": {"generation": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+        return_document=True,
+    )
+    return result["generation"]
+
+def current_generations(db) -> dict:
+    """
+    Current generation of every collection that has been loaded, e.g. {"dynamic_collection": 3}.
+    """
+    return {doc["_id"]: doc["generation"] for doc in db[META_COLLECTION].find({}, {"generation": 1})}
@@ -1,8 +1,11 @@
+import numpy as np
 import geopandas as gpd
+import shapely
 from pymongo import MongoClient, InsertOne
-from shapely.geometry import mapping
+from shapely.geometry import mapping, shape
 import yaml
-import time
+import instrumentation
+import generations
 
 def load_config(config_path: str) -> dict:
     with open(config_path, "r") as file:
@@ -17,7 +20,58 @@ def create_documents(gdf):
         doc['geometry'] = mapping(doc['geometry'])
     return documents
 
-def parse_file(file_path, encoding):
+def simplified_geometries(geometry, tolerances) -> list:
+    """
+    GeoJSON copies of a geometry simplified at each tolerance (degrees), finest first.
+    A simplified shape stays within `tolerance` of the original (Douglas-Peucker).
+    """
+    return [{"tolerance": tolerance, "geometry": mapping(geometry.simplify(tolerance, preserve_topology=True))}
+            for tolerance in sorted(tolerances)]
+
+def polygonal(geometry):
+    """
+    Polygonal part of an intersection result (drops the points and lines of a GeometryCollection).
+    """
+    if geometry.geom_type in ("Polygon", "MultiPolygon"):
+        return geometry
+    parts = [part for part in shapely.get_parts(geometry) if part.geom_type in ("Polygon", "MultiPolygon")]
+    return shapely.union_all(parts) if parts else None
+
+def tile_documents(document, tile_size) -> list:
+    """
+    Split a geodata document's polygon into grid tiles of tile_size degrees.
+
+    Returns:
+        List[dict]: One document per non-empty tile with loc_type, parent_fid, the tile's grid cell,
+        'interior' (the whole cell lies inside the polygon, so the tile is just the cell box)
+        and the tile geometry (cell box, or the polygon clipped to the cell).
+    """
+    geometry = shape(document["geometry"])
+    shapely.prepare(geometry)
+    minx, miny, maxx, maxy = geometry.bounds
+    columns = np.arange(np.floor(minx / tile_size), np.ceil(maxx / tile_size)).astype(int)
+    rows = np.arange(np.floor(miny / tile_size), np.ceil(maxy / tile_size)).astype(int)
+    column, row = (grid.ravel() for grid in np.meshgrid(columns, rows))
+    cells = shapely.box(column * tile_size, row * tile_size, (column + 1) * tile_size, (row + 1) * tile_size)
+
+    hits = shapely.intersects(geometry, cells)
+    column, row, cells = column[hits], row[hits], cells[hits]
+    interior = shapely.contains(geometry, cells)
+    tiles = []
+    for cell_column, cell_row, cell, is_interior in zip(column, row, cells, interior):
+        tile = cell if is_interior else polygonal(shapely.intersection(geometry, cell))
+        if tile is None or tile.is_empty:
+            continue
+        tiles.append({
+            "loc_type": document["loc_type"],
+            "parent_fid": document["fid"],
+            "cell": [int(cell_column), int(cell_row)],
+            "interior": bool(is_interior),
+            "geometry": mapping(tile),
+        })
+    return tiles
+
+def parse_file(file_path, encoding, tolerances=None, tiled_loc_types=()):
     gdf = gpd.read_file(file_path, encoding= encoding)
     gdf.columns = gdf.columns.str.lower() #lowercase all columns names
     
@@ -38,48 +92,82 @@ def parse_file(file_path, encoding):
     elif "territorial_waters" in file_path:
         gdf.insert(0, 'loc_type', 'territorial waters')
 
+    # Tiles refer to their parent polygon by fid: number the polygons of tiled types that have none
+    if "fid" not in gdf.columns and "loc_type" in gdf.columns and len(gdf) and gdf['loc_type'].iloc[0] in tiled_loc_types:
+        gdf.insert(0, "fid", range(len(gdf)))
+
+    # Coarser copies of every geometry for cheap first-pass spatial tests
+    if tolerances:
+        gdf['geometry_simplified'] = [simplified_geometries(geometry, tolerances) for geometry in gdf.geometry]
+
     return create_documents(gdf)
 
 def geodata_insert(documents, collection):
     # Insert documents to collection
     try:
-        result = collection.insert_many(documents)
+        with instrumentation.span("insert", collection=collection.name, loc_type=documents[0]['loc_type']):
+            result = collection.insert_many(documents)
+            instrumentation.count("documents_inserted", len(result.inserted_ids))
         print(f"Inserted {len(result.inserted_ids)} documents of type '{documents[0]['loc_type']}'.")
         return len(result.inserted_ids)
     except Exception as e:
         print(f'An error occured during insertion: {e}')
         return 0
 
-def main():
-    # Start time
-    start = time.time()
-
-    # Load config from YAML file
-    config = load_config("load_database/geo_config.yaml")
+def main(config_path="load_database/geo_config.yaml", collection_name=None):
+    # Load config from YAML file (collection_name overrides the target collection, e.g. for fastLoad.py)
+    config = load_config(config_path)
+    config["collection"] = collection_name or config["collection"]
+    instrumentation.configure(config.get("trace_path"))
 
     # Connect to MongoDB
-    client = MongoClient(config["mongo_uri"])
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()])
     db = client[config["database"]]
     collection = db[config["collection"]]
 
+    # Large polygons are also stored as tiles (see tile_documents)
+    tiles_config = config.get("tiles") or {}
+    tiles_collection = db[tiles_config.get("collection", "geodata_tiles")]
+
     total_inserts = 0 
-    # Process each shapefile specified in the config
-    for shapefile_config in config["shapefiles"]:
-        file_path = shapefile_config["file_path"]
-        encoding = shapefile_config["encoding"]
-        print(f"Processing shapefile: {file_path} ...")
+    result = {"documents": 0, "inserted": 0, "failed_files": []}
+    with instrumentation.span("load_geodata") as total:
+        # Process each shapefile specified in the config
+        for shapefile_config in config["shapefiles"]:
+            file_path = shapefile_config["file_path"]
+            encoding = shapefile_config["encoding"]
+            print(f"Processing shapefile: {file_path} ...")
+
+            with instrumentation.span("parse", file=file_path):
+                documents = parse_file(file_path, encoding, config.get("simplify_tolerances"), tiles_config.get("loc_types", []))
+                instrumentation.count("rows", len(documents))
+            inserts = geodata_insert(documents, collection)
+            total_inserts += inserts
+            result["documents"] += len(documents)
+            result["inserted"] += inserts
+            if inserts < len(documents):
+                result["failed_files"].append(file_path)
 
-        documents = parse_file(file_path, encoding)
-        inserts = geodata_insert(documents, collection)
-        total_inserts += inserts
+            if documents and documents[0]['loc_type'] in tiles_config.get("loc_types", []):
+                with instrumentation.span("tile", file=file_path):
+                    tiles = [tile for doc in documents for tile in tile_documents(doc, tiles_config["tile_size"])]
+                    # Replace the tiles of a previous load of the same shapefile (kept when none were produced)
+                    if tiles:
+                        tiles_collection.delete_many({"loc_type": documents[0]['loc_type']})
+                        tiles_collection.insert_many(tiles)
+                print(f"Inserted {len(tiles)} tiles of type '{documents[0]['loc_type']}'.")
 
+    # New data: invalidate cached query results
+    generations.bump_generation(db, config["collection"])
+    generations.bump_generation(db, tiles_collection.name)
     client.close()
     # Total count of inserts
     print('---------------------------------------')
     print(f'Inserted {total_inserts} documents in total.')
     
     # Execution time
-    print(f'Executed in {time.time() - start:.4f} seconds.')
+    print(f'Executed in {total["duration_ms"] / 1000:.4f} seconds.')
+    return result
 
 if __name__=='__main__':
     main()
\ No newline at end of file
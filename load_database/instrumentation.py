@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import atexit
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pymongo import monitoring
+
+class Tracer:
+    """
+    Collects timed spans, counters and MongoDB command latencies and writes them as JSON lines.
+
+    Every finished span and every server command becomes one line; counters are attached to the
+    innermost open span and summed into a totals line when the tracer is flushed.
+    The open span is tracked per context (thread or asyncio task), so concurrent queries on
+    one event loop do not nest into each other's spans.
+    """
+
+    def __init__(self, path=None):
+        self.totals = defaultdict(int)
+        self.records = []           # kept in memory when no path is configured
+        self._current = ContextVar(f"span_{id(self)}", default=None)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = None
+        self.path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    @path.setter
+    def path(self, path):
+        with self._lock:
+            self.close()
+            self._path = path
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def current(self):
+        return self._current.get()
+
+    def emit(self, record: dict):
+        with self._lock:
+            if self._path:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                    self._file = open(self._path, "a")
+                self._file.write(json.dumps(record, default=str) + "\n")
+            else:
+                self.records.append(record)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Time a block. Yields the span record; 'duration_ms' is set when the block exits.
+        """
+        parent = self.current()
+        record = {
+            "type": "span",
+            "id": next(self._ids),
+            "name": name,
+            "parent": parent["name"] if parent else None,
+            "parent_id": parent["id"] if parent else None,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "attrs": attrs,
+            "counters": {},
+        }
+        token = self._current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = repr(e)
+            raise
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._current.reset(token)
+            self.emit(record)
+
+    def count(self, name: str, value=1):
+        """
+        Add value to a counter (rows, documents, bytes, ...) of the current span and of the totals.
+        """
+        with self._lock:
+            self.totals[name] += value
+        record = self.current()
+        if record is not None:
+            record["counters"][name] = record["counters"].get(name, 0) + value
+
+    def flush(self):
+        if self.totals:
+            self.emit({"type": "totals", "at": datetime.now(timezone.utc).isoformat(), "counters": dict(self.totals)})
+            self.totals.clear()
+        with self._lock:
+            self.close()
+
+class CommandTracer(monitoring.CommandListener):
+    """
+    pymongo command listener that records the server-side latency of every command.
+    Commands are tagged with the span that was open in the calling thread or task.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans = {}
+
+    def started(self, event):
+        current = self.tracer.current()
+        self._spans[event.request_id] = (current["name"], current["id"]) if current else (None, None)
+
+    def _record(self, event, ok):
+        span_name, span_id = self._spans.pop(event.request_id, (None, None))
+        self.tracer.emit({
+            "type": "command",
+            "command": event.command_name,
+            "database": event.database_name,
+            "duration_ms": event.duration_micros / 1000,
+            "ok": ok,
+            "span": span_name,
+            "span_id": span_id,
+        })
+
+    def succeeded(self, event):
+        self._record(event, True)
+
+    def failed(self, event):
+        self._record(event, False)
+
+# Process-wide tracer used by the loaders and the queries
+tracer = Tracer()
+span = tracer.span
+count = tracer.count
+atexit.register(tracer.flush)
+
+def configure(path):
+    """
+    Export the process-wide tracer to a JSON-lines file (None keeps records in memory).
+    """
+    tracer.path = path
+
+def command_listener() -> CommandTracer:
+    """
+    Listener to pass to MongoClient(event_listeners=[...]).
+    """
+    return CommandTracer(tracer)
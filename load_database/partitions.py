@@ -0,0 +1,83 @@
+import sys
+from datetime import datetime, timezone
+import pandas as pd
+from pymongo import MongoClient, GEOSPHERE, ASCENDING
+import yaml
+
+# One document per month partition: name, base collection, [start, end) and document count
+CATALOG = "dynamic_partitions"
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def partition_name(base: str, month) -> str:
+    return f"{base}_{month:%Y_%m}"
+
+def month_bounds(month) -> tuple:
+    start = pd.Timestamp(month).to_period("M").start_time
+    return start.to_pydatetime(), (start + pd.offsets.MonthBegin(1)).to_pydatetime()
+
+def split_by_month(documents) -> dict:
+    """
+    Bucket documents grouped by the month of their timestamp_start.
+    """
+    months = {}
+    for doc in documents:
+        month = month_bounds(doc["timestamp_start"])[0]
+        months.setdefault(month, []).append(doc)
+    return months
+
+def ensure_partition_indexes(collection):
+    """
+    Indexes every partition carries (small per-month indexes instead of one ever-growing one).
+    """
+    collection.create_index([("positions.geometry", GEOSPHERE)])
+    collection.create_index([("timestamp_start", ASCENDING)])
+    collection.create_index([("track", GEOSPHERE)])
+
+def register_partition(db, base: str, month, documents: int):
+    name = partition_name(base, month)
+    start, end = month_bounds(month)
+    db[CATALOG].update_one(
+        {"_id": name},
+        {"$set": {"base": base, "start": start, "end": end, "updated_at": datetime.now(timezone.utc)},
+         "$setOnInsert": {"state": "active"},
+         "$inc": {"documents": documents}},
+        upsert=True,
+    )
+
+def compact_partition(db, name: str):
+    """
+    Reclaim the space of one (e.g. cleaned or trimmed) month without touching the others.
+    """
+    result = db.command("compact", name)
+    print(f"Compacted {name}: {result}")
+
+def archive_partition(db, name: str, archive_database: str):
+    """
+    Move one month to the archive database and drop it from the live one; routed queries skip it.
+    """
+    db[name].aggregate([{"$out": {"db": archive_database, "coll": name}}])
+    db[name].drop()
+    db[CATALOG].update_one({"_id": name}, {"$set": {"state": "archived", "archive_database": archive_database}})
+    print(f"Archived {name} to {archive_database}")
+
+def main(config_path="load_database/dynamic_config.yaml"):
+    config = load_config(config_path)
+    client = MongoClient(config["mongo_uri"])
+    db = client[config["database"]]
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        for partition in db[CATALOG].find({"base": config["collection"]}).sort("start", 1):
+            print(f"{partition['_id']}: {partition['start']:%Y-%m} {partition['state']} {partition['documents']} documents")
+    elif command == "compact":
+        compact_partition(db, sys.argv[2])
+    elif command == "archive":
+        archive_partition(db, sys.argv[2], config["database"] + "_archive")
+    else:
+        print("Usage: python load_database/partitions.py list | compact <partition> | archive <partition>")
+    client.close()
+
+if __name__ == "__main__":
+    main()
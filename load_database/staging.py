@@ -0,0 +1,145 @@
+import hashlib
+import os
+import pandas as pd
+import geopandas as gpd
+import pyarrow.feather as feather
+
+# Bump whenever the typed layout of a staged file changes, so stale files are ignored
+STAGING_VERSION = 1
+
+# Column types of the raw AIS dynamic CSVs
+DYNAMIC_DTYPES = {
+    "vessel_id": str,
+    "lon": "float64",
+    "lat": "float64",
+    "speed": "float64",
+    "heading": "float64",
+    "course": "float64",
+}
+
+# Sidecar files that together make up a shapefile
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+def file_digest(paths, extra="", chunk_size=8 * 1024 * 1024) -> str:
+    """
+    Hash the content of one or more files (plus an optional salt) in fixed-size chunks.
+
+    Args:
+        paths: List of file paths; missing files are skipped.
+        extra: Extra string mixed into the hash (e.g. encoding or staging version).
+        chunk_size: Bytes read per iteration.
+
+    Returns:
+        str: Hex SHA-1 digest.
+    """
+    digest = hashlib.sha1(f"v{STAGING_VERSION}:{extra}".encode("utf-8"))
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def staged_path(staging_dir: str, file_path: str, digest: str) -> str:
+    """
+    Build the staged file name from the source file name and its content hash.
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(staging_dir, f"{stem}_{digest[:16]}.feather")
+
+def write_staged(df, path: str):
+    """
+    Write a frame as an uncompressed Feather (Arrow IPC) file so it can be memory-mapped.
+    A temporary file is renamed into place, so an interrupted run never leaves a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    if isinstance(df, gpd.GeoDataFrame):
+        df.to_feather(tmp_path, compression="uncompressed")
+    else:
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+def parse_dynamic_csv(file_path: str) -> pd.DataFrame:
+    """
+    Parse a raw AIS dynamic CSV into a typed frame with a 'timestamp' datetime column.
+    """
+    dynamic_df = pd.read_csv(file_path, dtype=DYNAMIC_DTYPES)
+    if 't' in dynamic_df.columns:
+        dynamic_df['timestamp'] = pd.to_datetime(dynamic_df['t'], unit='ms')
+    elif 'timestamp' in dynamic_df.columns:
+        dynamic_df['timestamp'] = pd.to_datetime(dynamic_df['timestamp'], unit='ms')
+    else:
+        raise ValueError("Neither 't' nor 'timestamp' column found in the dataset.")
+    return dynamic_df
+
+def parse_weather_shapefile(file_path: str, encoding="ISO-8859-1") -> gpd.GeoDataFrame:
+    """
+    Parse a NOAA weather shapefile and convert its 'timestamp' column to datetime.
+    """
+    gdf = gpd.read_file(file_path, encoding=encoding)
+    gdf['timestamp'] = pd.to_datetime(gdf['timestamp'])
+    return gdf
+
+def load_dynamic(file_path: str, staging_dir=None) -> pd.DataFrame:
+    """
+    Load an AIS dynamic CSV, reusing its staged Feather copy when one exists.
+
+    Args:
+        file_path: Path of the raw CSV file.
+        staging_dir: Directory holding staged files. If None, the CSV is always parsed.
+
+    Returns:
+        pd.DataFrame: Typed frame as returned by parse_dynamic_csv.
+    """
+    if not staging_dir:
+        return parse_dynamic_csv(file_path)
+
+    path = staged_path(staging_dir, file_path, file_digest([file_path]))
+    if os.path.exists(path):
+        print(f"Using staged file: {path}")
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+    dynamic_df = parse_dynamic_csv(file_path)
+    write_staged(dynamic_df, path)
+    print(f"Staged {len(dynamic_df)} rows to {path}")
+    return dynamic_df
+
+def stage_dynamic(file_path: str, staging_dir: str) -> str:
+    """
+    Make sure an AIS dynamic CSV is staged and return the path of its Feather file.
+    """
+    path = staged_path(staging_dir, file_path, file_digest([file_path]))
+    if not os.path.exists(path):
+        dynamic_df = parse_dynamic_csv(file_path)
+        write_staged(dynamic_df, path)
+        print(f"Staged {len(dynamic_df)} rows to {path}")
+    return path
+
+def load_weather(file_path: str, staging_dir=None, encoding="ISO-8859-1") -> gpd.GeoDataFrame:
+    """
+    Load a NOAA weather shapefile, reusing its staged Feather copy when one exists.
+
+    Args:
+        file_path: Path of the .shp file; its sidecar files are hashed as well.
+        staging_dir: Directory holding staged files. If None, the shapefile is always parsed.
+        encoding: Encoding of the attribute table.
+
+    Returns:
+        gpd.GeoDataFrame: Frame as returned by parse_weather_shapefile.
+    """
+    if not staging_dir:
+        return parse_weather_shapefile(file_path, encoding)
+
+    base = os.path.splitext(file_path)[0]
+    parts = [base + ext for ext in SHAPEFILE_PARTS]
+    path = staged_path(staging_dir, file_path, file_digest(parts, extra=encoding))
+    if os.path.exists(path):
+        print(f"Using staged file: {path}")
+        return gpd.read_feather(path, memory_map=True)
+
+    gdf = parse_weather_shapefile(file_path, encoding)
+    write_staged(gdf, path)
+    print(f"Staged {len(gdf)} rows to {path}")
+    return gdf
@@ -0,0 +1,163 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import yaml
+
+KNOT_MS = 0.514444              # meters per second in one knot
+METERS_PER_DEGREE = 111320.0    # meters per degree of latitude
+OUTPUT_COLUMNS = ["t", "vessel_id", "lon", "lat", "speed", "heading", "course"]
+
+# Load configuration
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def load_coverage(coverage_path: str):
+    """
+    Union of the coverage polygons, prepared for fast vectorized containment tests.
+    """
+    gdf = gpd.read_file(coverage_path, encoding="ISO-8859-1")
+    area = shapely.union_all(gdf.geometry.values)
+    shapely.prepare(area)
+    return area
+
+def random_points_in(area, n, rng):
+    """
+    Draw n uniform points inside a polygon by rejection sampling from its bounding box.
+    """
+    min_lon, min_lat, max_lon, max_lat = area.bounds
+    lon, lat = np.empty(0), np.empty(0)
+    while len(lon) < n:
+        cand_lon = rng.uniform(min_lon, max_lon, 2 * n)
+        cand_lat = rng.uniform(min_lat, max_lat, 2 * n)
+        inside = shapely.contains_xy(area, cand_lon, cand_lat)
+        lon = np.concatenate([lon, cand_lon[inside]])
+        lat = np.concatenate([lat, cand_lat[inside]])
+    return lon[:n], lat[:n]
+
+class TrackSimulator:
+    """
+    Vectorized random-walk simulation of vessel tracks inside an area.
+    Every step moves all vessels at once; vessels that would leave the area turn around.
+    """
+
+    def __init__(self, vessel_ids, area, rng, interval_s=60.0, anchored_share=0.3):
+        n = len(vessel_ids)
+        self.vessel_ids = np.asarray(vessel_ids)
+        self.area = area
+        self.rng = rng
+        self.interval_s = interval_s
+        self.lon, self.lat = random_points_in(area, n, rng)
+        self.anchored = rng.random(n) < anchored_share
+        self.speed = np.where(self.anchored, 0.0, rng.gamma(4.0, 3.0, n).clip(1, 25))     # knots
+        self.course = rng.uniform(0, 360, n)                                                # degrees
+
+    def step(self, t_ms):
+        """
+        Advance one interval and return the fixes reported in it, as a DataFrame.
+        """
+        n = len(self.vessel_ids)
+        dt = self.interval_s
+
+        # Course and speed drift of moving vessels
+        moving = ~self.anchored
+        self.course = np.where(moving, (self.course + self.rng.normal(0, 5, n)) % 360, self.course)
+        self.speed = np.where(moving, (self.speed + self.rng.normal(0, 0.3, n)).clip(0.5, 25), 0.0)
+
+        # Move along the course; keep the old position and turn around when leaving the area
+        distance = self.speed * KNOT_MS * dt
+        course_rad = np.radians(self.course)
+        new_lat = self.lat + distance * np.cos(course_rad) / METERS_PER_DEGREE
+        new_lon = self.lon + distance * np.sin(course_rad) / (METERS_PER_DEGREE * np.cos(np.radians(self.lat)))
+        inside = shapely.contains_xy(self.area, new_lon, new_lat)
+        self.lon = np.where(inside, new_lon, self.lon)
+        self.lat = np.where(inside, new_lat, self.lat)
+        self.course = np.where(inside, self.course, (self.course + 180 + self.rng.normal(0, 20, n)) % 360)
+
+        # Moving vessels report almost every interval, anchored ones rarely
+        reports = self.rng.random(n) < np.where(self.anchored, 0.1, 0.9)
+        jitter = self.rng.integers(0, int(dt * 1000), n)
+        idx = np.flatnonzero(reports)
+
+        # GPS noise for anchored vessels
+        noise = np.where(self.anchored[idx], 0.00002, 0.0)
+        fixes = pd.DataFrame({
+            "t": t_ms + jitter[idx],
+            "vessel_id": self.vessel_ids[idx],
+            "lon": np.round(self.lon[idx] + self.rng.normal(0, 1, len(idx)) * noise, 7),
+            "lat": np.round(self.lat[idx] + self.rng.normal(0, 1, len(idx)) * noise, 7),
+            "speed": np.round(self.speed[idx], 1),
+            "heading": np.round((self.course[idx] + self.rng.normal(0, 3, len(idx))) % 360).astype(int) % 360,
+            "course": np.round(self.course[idx], 1),
+        })
+        return fixes.sort_values("t", kind="stable")
+
+def generate_file(simulator, file_path, start, end, chunk_rows=1000000) -> int:
+    """
+    Simulate [start, end) and append the fixes to file_path in chunks of about chunk_rows rows.
+
+    Returns:
+        int: Number of rows written.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    step_ms = int(simulator.interval_s * 1000)
+    t_ms = int(pd.Timestamp(start).value // 10**6)
+    end_ms = int(pd.Timestamp(end).value // 10**6)
+
+    total, buffered, chunks = 0, 0, []
+    header = True
+    with open(file_path, "w", newline="") as file:
+        while t_ms < end_ms:
+            fixes = simulator.step(t_ms)
+            fixes = fixes[fixes["t"] < end_ms]
+            chunks.append(fixes)
+            buffered += len(fixes)
+            t_ms += step_ms
+
+            if buffered >= chunk_rows or t_ms >= end_ms:
+                chunk = pd.concat(chunks, ignore_index=True)[OUTPUT_COLUMNS]
+                chunk.to_csv(file, index=False, header=header)
+                header = False
+                total += len(chunk)
+                chunks, buffered = [], 0
+    return total
+
+def write_dynamic_config(config, dynamic_config_path="load_database/dynamic_config.yaml"):
+    """
+    Write a loader config pointing dynamicParser at the generated files.
+    """
+    dynamic_config = load_config(dynamic_config_path)
+    dynamic_config["files"] = [{"file_path": entry["file_path"]} for entry in config["files"]]
+    os.makedirs(os.path.dirname(config["dynamic_config_path"]), exist_ok=True)
+    with open(config["dynamic_config_path"], "w") as file:
+        yaml.safe_dump(dynamic_config, file, sort_keys=False)
+
+def main(config_path="load_database/synthetic_config.yaml"):
+    start_time = time.time()
+    config = load_config(config_path)
+    rng = np.random.default_rng(config["seed"])
+
+    # Vessel ids of the static data, so generated tracks join with vessels_collection
+    vessel_ids = pd.read_csv(config["vessel_data_path"])["vessel_id"].drop_duplicates().to_numpy()
+    vessel_ids = rng.choice(vessel_ids, size=min(config["vessels"], len(vessel_ids)), replace=False)
+
+    area = load_coverage(config["coverage_path"])
+    simulator = TrackSimulator(vessel_ids, area, rng,
+                               interval_s=config["report_interval_s"] / config.get("scale", 1),
+                               anchored_share=config.get("anchored_share", 0.3))
+
+    for file_entry in config["files"]:
+        print(f"Generating file: {file_entry['file_path']}")
+        rows = generate_file(simulator, file_entry["file_path"], file_entry["start"], file_entry["end"],
+                             config.get("chunk_rows", 1000000))
+        print(f"Wrote {rows} rows to {file_entry['file_path']}")
+
+    write_dynamic_config(config)
+    print(f"Loader config written to {config['dynamic_config_path']}")
+    print(f"Total Execution Time: {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
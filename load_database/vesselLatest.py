@@ -0,0 +1,64 @@
+from datetime import datetime
+import pandas as pd
+from pymongo import UpdateOne
+import instrumentation
+
+# One document per vessel with its latest fix (2dsphere index on 'geometry', see index_config.yaml)
+COLLECTION = "vessel_latest"
+
+def latest_fixes(positions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Latest row per vessel of a positions frame (vessel_id, timestamp, lon, lat, speed, heading, course).
+    """
+    latest = positions.sort_values("timestamp").drop_duplicates("vessel_id", keep="last")
+    latest = latest[["vessel_id", "timestamp", "lon", "lat", "speed", "heading", "course"]].astype(object)
+    return latest.where(latest.notna(), None)  # BSON-encodable Python values
+
+def latest_updates(positions: pd.DataFrame) -> list:
+    """
+    One conditional upsert per vessel: the stored fix is only replaced by a newer one
+    ($max-like on the timestamp), so loads and changes may be applied out of order or twice.
+    """
+    updates = []
+    for row in latest_fixes(positions).itertuples(index=False):
+        document = {
+            "_id": row.vessel_id,
+            "vessel_id": row.vessel_id,
+            "timestamp": row.timestamp,
+            "geometry": {"type": "Point", "coordinates": [row.lon, row.lat]},
+            "speed": row.speed,
+            "heading": row.heading,
+            "course": row.course,
+        }
+        is_newer = {"$gt": [row.timestamp, {"$ifNull": ["$timestamp", datetime.min]}]}
+        updates.append(UpdateOne(
+            {"_id": row.vessel_id},
+            [{"$replaceWith": {"$cond": [is_newer, {"$literal": document}, "$$ROOT"]}}],
+            upsert=True,
+        ))
+    return updates
+
+def previous_fixes(collection, vessel_ids) -> dict:
+    """
+    Stored latest fix of each given vessel, as a bucket's previous_fix ({timestamp, coordinates}).
+    Lets the first bucket of a vessel in a file link to the fixes of files loaded before it.
+    """
+    cursor = collection.find({"_id": {"$in": list(vessel_ids)}}, {"timestamp": 1, "geometry.coordinates": 1})
+    return {doc["_id"]: {"timestamp": doc["timestamp"], "coordinates": doc["geometry"]["coordinates"]}
+            for doc in cursor if doc.get("timestamp") and doc.get("geometry")}
+
+def update_latest(collection, positions: pd.DataFrame, batch_size=10000) -> int:
+    """
+    Fold a positions frame into the vessel_latest collection with bulk conditional upserts.
+
+    Returns:
+        int: Number of vessels upserted or updated.
+    """
+    updates = latest_updates(positions)
+    changed = 0
+    with instrumentation.span("latest", collection=collection.name):
+        for start in range(0, len(updates), batch_size):
+            result = collection.bulk_write(updates[start:start + batch_size], ordered=False)
+            changed += result.upserted_count + result.modified_count
+        instrumentation.count("vessels_updated", changed)
+    return changed
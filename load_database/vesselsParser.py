@@ -1,8 +1,14 @@
 import pandas as pd
 import numpy as np
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 import json
 import yaml
+import instrumentation
+import generations
+
+# Length of the description n-grams used by the query 2 index
+NGRAM_SIZE = 3
 
 # Load configuration from YAML file
 def load_config(config_path: str) -> dict:
@@ -41,15 +47,29 @@ def insert_data_to_mongo(collection, data: list):
     # Split documents if they exceed the 16MB size limit
     split_docs = split_documents(data)
     
+    # Number of documents inserted (fewer than len(data) when a batch failed)
+    inserted = 0
     for batch in split_docs:
         try:
-            result = collection.insert_many(batch, ordered=False)
+            with instrumentation.span("insert", collection=collection.name):
+                result = collection.insert_many(batch, ordered=False)
+                instrumentation.count("documents_inserted", len(result.inserted_ids))
             print(f"Inserted {len(result.inserted_ids)} documents.")
+            inserted += len(result.inserted_ids)
         except Exception as e:
             print(f"An error occurred during insertion: {e}")
+            inserted += e.details.get("nInserted", 0) if isinstance(e, BulkWriteError) else 0
+    return inserted
 
-# Function to process the vessel data and insert it into MongoDB
-def process_vessel_data(vessel_data_path: str, type_codes_path: str, collection):
+# Lowercase n-grams of a text, sorted and without duplicates ([] for missing or short texts)
+def ngrams(text, n=NGRAM_SIZE) -> list:
+    if not isinstance(text, str):
+        return []
+    text = text.lower()
+    return sorted({text[i:i + n] for i in range(len(text) - n + 1)})
+
+# Build the vessel frame (vessel_id, country, type_code, description) from the static CSVs
+def build_vessel_frame(vessel_data_path: str, type_codes_path: str) -> pd.DataFrame:
     # Load and clean raw data
     vessels_df = pd.read_csv(vessel_data_path)
     types_df = pd.read_csv(type_codes_path)
@@ -67,29 +87,46 @@ def process_vessel_data(vessel_data_path: str, type_codes_path: str, collection)
     vessels_df["type_code"] = vessels_df["shiptype"].astype(str)  # Ensure type_code is string  
     vessels_df["description"] = vessels_df["type_code"].map(type_code_to_description)
     vessels_df["type_code"] = vessels_df["shiptype"] # turn the field again into an int 
+
+    # Precompute description n-grams for the multikey (country, description_ngrams) index
+    vessels_df["description_ngrams"] = vessels_df["description"].map(ngrams)
     
     # Select and reorder columns to match MongoDB schema
-    mongo_data = vessels_df[["vessel_id", "country", "type_code", "description"]]
+    return vessels_df[["vessel_id", "country", "type_code", "description", "description_ngrams"]]
+
+# Function to process the vessel data and insert it into MongoDB
+def process_vessel_data(vessel_data_path: str, type_codes_path: str, collection):
+    with instrumentation.span("parse", file=vessel_data_path):
+        mongo_data = build_vessel_frame(vessel_data_path, type_codes_path)
+        instrumentation.count("rows", len(mongo_data))
     
     # Convert the DataFrame to a list of dictionaries for MongoDB insertion
     mongo_data_list = mongo_data.to_dict(orient="records")
 
     # Insert data into MongoDB
-    insert_data_to_mongo(collection, mongo_data_list)
+    inserted = insert_data_to_mongo(collection, mongo_data_list)
+    return {"documents": len(mongo_data_list), "inserted": inserted,
+            "failed_files": [vessel_data_path] if inserted < len(mongo_data_list) else []}
 
 # Main execution function
-def main():
-    # Load config from YAML file
-    config = load_config("load_database/vessel_config.yaml")
+def main(config_path="load_database/vessel_config.yaml", collection_name=None):
+    # Load config from YAML file (collection_name overrides the target collection, e.g. for fastLoad.py)
+    config = load_config(config_path)
+    config["collection"] = collection_name or config["collection"]
+    instrumentation.configure(config.get("trace_path"))
 
     # Connect to MongoDB
-    client = MongoClient(config["mongo_uri"])
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()])
     db = client[config["database"]]
     collection = db[config["collection"]]
 
     # Process vessel data and insert into MongoDB
-    process_vessel_data(config["vessel_data_path"], config["type_codes_path"], collection)
+    result = process_vessel_data(config["vessel_data_path"], config["type_codes_path"], collection)
+
+    # New data: invalidate cached query results
+    generations.bump_generation(db, config["collection"])
     client.close()
+    return result
     
 if __name__ == "__main__":
     main()
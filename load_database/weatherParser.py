@@ -2,10 +2,13 @@ import geopandas as gpd
 import pandas as pd
 from shapely.geometry import mapping
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from bson import BSON
-import time
 import json
 import yaml
+import staging
+import instrumentation
+import generations
 
 # Load configuration from YAML file
 def load_config(config_path: str) -> dict:
@@ -23,6 +26,7 @@ def split_documents(documents: list) -> list:
     
     for document in documents:
         doc_size = len(BSON.encode(document)) #len(json.dumps(document).encode('utf-8'))  # Calculate document size in bytes
+        instrumentation.count("bson_bytes", doc_size)
         if current_size + doc_size > MAX_SIZE:
             # If adding this document exceeds the max size, push the current document and reset
             split_docs.append(current_doc)
@@ -42,14 +46,22 @@ def split_documents(documents: list) -> list:
 # Insert data into MongoDB
 def insert_data_to_mongo(collection, data: list):
     # Split documents if they exceed the 16MB size limit
-    split_docs = split_documents(data)
+    with instrumentation.span("encode"):
+        split_docs = split_documents(data)
     
+    # Number of documents inserted (fewer than len(data) when a batch failed)
+    inserted = 0
     for batch in split_docs:
         try:
-            result = collection.insert_many(batch, ordered=False)
+            with instrumentation.span("insert", collection=collection.name):
+                result = collection.insert_many(batch, ordered=False)
+                instrumentation.count("documents_inserted", len(result.inserted_ids))
             print(f"Inserted {len(result.inserted_ids)} documents.")
+            inserted += len(result.inserted_ids)
         except Exception as e:
             print(f"An error occurred during insertion: {e}")
+            inserted += e.details.get("nInserted", 0) if isinstance(e, BulkWriteError) else 0
+    return inserted
 
 # Define file paths from YAML
 def define_file_paths(config):
@@ -58,22 +70,21 @@ def define_file_paths(config):
 # Connect to MongoDB
 def mongo_connect(config):
     # Connect to MongoDB using credentials from the YAML file
-    client = MongoClient(config["mongo_uri"])
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()])
     db = client[config["database"]]
     collection = db[config["collection"]]
     return client, collection
 
 # Parse and insert data from shapefiles
-def parse_insert(file_paths, collection):
+def parse_insert(file_paths, collection, staging_dir=None):
     # Merge month files into one geodataframe
     combined_gdf = gpd.GeoDataFrame()
     for file in file_paths:
         print(f"Processing {file}")
-        # Parse the file
-        gdf = gpd.read_file(file, encoding='ISO-8859-1')  # Encoding of .cpg file
-
-        # Properly define timestamp columns
-        gdf['timestamp'] = pd.to_datetime(gdf['timestamp'])
+        # Parse the file and properly define timestamp columns (cached in the staging directory)
+        with instrumentation.span("parse", file=file):
+            gdf = staging.load_weather(file, staging_dir, encoding='ISO-8859-1')  # Encoding of .cpg file
+            instrumentation.count("rows", len(gdf))
         #gdf['timestamp'] = gdf['timestamp']#.apply(lambda time: time.isoformat())
         #gdf['timestamp_'] = pd.to_datetime(gdf['timestamp_'], unit='s')  # UNIX timestamp in seconds
         #gdf['timestamp_'] = gdf['timestamp_']#.apply(lambda time: time.isoformat())
@@ -81,37 +92,38 @@ def parse_insert(file_paths, collection):
         # Stack the geodataframes
         combined_gdf = pd.concat([combined_gdf, gdf], ignore_index=True)
 
-    # Drop unwanted columns
-    combined_gdf.drop(columns=['lon', 'lat'], inplace=True)
-
-    # Group the data based on timestamp range
-    combined_gdf['timestamp_start'] = combined_gdf['timestamp'].min()
-    combined_gdf['timestamp_end'] = combined_gdf['timestamp'].max()
-    grouped = combined_gdf.groupby(['geometry', 'timestamp_start', 'timestamp_end'])
-
-    # Create a bucket-pattern list of dictionaries
-    bucket_doc = []
-    for (geometry, timestamp_start, timestamp_end), group in grouped:
-        measurements = group.drop(columns= ['geometry', 'timestamp_start', 'timestamp_end']) # exclude unwanted from measurements
-        bucket = {
-            'geometry': mapping(geometry),  # Ensure geometry is in GeoJSON format
-            'timestamp_start': timestamp_start,
-            'timestamp_end': timestamp_end,
-            'measurements': measurements.to_dict(orient='records')
-        }
-        bucket_doc.append(bucket)
+    with instrumentation.span("bucket"):
+        # Drop unwanted columns
+        combined_gdf.drop(columns=['lon', 'lat'], inplace=True)
+
+        # Group the data based on timestamp range
+        combined_gdf['timestamp_start'] = combined_gdf['timestamp'].min()
+        combined_gdf['timestamp_end'] = combined_gdf['timestamp'].max()
+        grouped = combined_gdf.groupby(['geometry', 'timestamp_start', 'timestamp_end'])
+
+        # Create a bucket-pattern list of dictionaries
+        bucket_doc = []
+        for (geometry, timestamp_start, timestamp_end), group in grouped:
+            measurements = group.drop(columns= ['geometry', 'timestamp_start', 'timestamp_end']) # exclude unwanted from measurements
+            bucket = {
+                'geometry': mapping(geometry),  # Ensure geometry is in GeoJSON format
+                'timestamp_start': timestamp_start,
+                'timestamp_end': timestamp_end,
+                'measurements': measurements.to_dict(orient='records')
+            }
+            bucket_doc.append(bucket)
 
     # Insert the documents into MongoDB
-    insert_data_to_mongo(collection, bucket_doc)
+    inserted = insert_data_to_mongo(collection, bucket_doc)
 
-    return len(bucket_doc)
+    return len(bucket_doc), inserted
 
 # Main execution function
-def main():
-    start = time.time()
-    
-    # Load config from YAML file
-    config = load_config("load_database/weather_config.yaml")
+def main(config_path="load_database/weather_config.yaml", collection_name=None):
+    # Load config from YAML file (collection_name overrides the target collection, e.g. for fastLoad.py)
+    config = load_config(config_path)
+    config["collection"] = collection_name or config["collection"]
+    instrumentation.configure(config.get("trace_path"))
 
     # Define the file paths
     file_paths = define_file_paths(config)
@@ -121,14 +133,23 @@ def main():
 
     # Parse the files and insert final documents to MongoDB
     total_inserts = 0
-    for file_path_quarter in file_paths:
-        inserts = parse_insert(file_path_quarter, collection)  # Each iteration is a year's quarter (3 files/iteration)
-        total_inserts += inserts
-
+    result = {"documents": 0, "inserted": 0, "failed_files": []}
+    with instrumentation.span("load_weather") as total:
+        for file_path_quarter in file_paths:
+            documents, inserts = parse_insert(file_path_quarter, collection, config.get("staging_dir"))  # Each iteration is a year's quarter (3 files/iteration)
+            total_inserts += inserts
+            result["documents"] += documents
+            result["inserted"] += inserts
+            if inserts < documents:
+                result["failed_files"].extend(file_path_quarter)
+
+    # New data: invalidate cached query results
+    generations.bump_generation(collection.database, collection.name)
     client.close()  # Close MongoDB connection
     print('--------------')
     print(f'Total documents inserted: {total_inserts}.')
-    print(f'Executed in {time.time() - start:.4f} seconds.')
+    print(f'Executed in {total["duration_ms"] / 1000:.4f} seconds.')
+    return result
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,429 @@
+import re
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape, mapping
+from pymongo import MongoClient, UpdateOne, DeleteOne, DeleteMany, ASCENDING
+from pymongo.errors import OperationFailure
+import yaml
+
+# Tracing and generation counters live next to the loaders
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import instrumentation
+import generations
+import vesselLatest
+import partitions
+
+# Change events that modify documents (the others are collection-level: rename, drop, invalidate)
+DOCUMENT_OPERATIONS = ("insert", "update", "replace", "delete")
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+class RegionIndex:
+    """
+    Region polygons of geodata_collection in an STRtree, for vectorized point-in-region lookups.
+    """
+
+    def __init__(self, documents, name_field="per"):
+        documents = [doc for doc in documents if doc.get("geometry")]
+        self.ids = [str(doc["_id"]) for doc in documents]
+        self.names = [doc.get(name_field) for doc in documents]
+        self.tree = shapely.STRtree([shape(doc["geometry"]) for doc in documents])
+
+    @classmethod
+    def from_collection(cls, collection, loc_type="region", name_field="per"):
+        return cls(collection.find({"loc_type": loc_type}, {"geometry": 1, name_field: 1}), name_field)
+
+    def locate(self, lon, lat) -> np.ndarray:
+        """
+        Index of the region containing each point, -1 outside every region.
+        """
+        located = np.full(len(lon), -1)
+        if len(self.ids) and len(lon):
+            points, regions = self.tree.query(shapely.points(lon, lat), predicate="within")
+            located[points] = regions
+        return located
+
+def bucket_positions(documents) -> pd.DataFrame:
+    """
+    One row per position of the given bucket documents: vessel_id, timestamp, lon, lat, speed, heading, course.
+    """
+    rows = [(doc["vessel_id"], position["timestamp"], *position["geometry"]["coordinates"][:2],
+             position.get("speed"), position.get("heading"), position.get("course"))
+            for doc in documents for position in doc.get("positions", [])]
+    return pd.DataFrame(rows, columns=["vessel_id", "timestamp", "lon", "lat", "speed", "heading", "course"])
+
+def region_hour_groups(positions: pd.DataFrame, regions: RegionIndex):
+    """
+    The positions inside a region, grouped by (region index, hour).
+    """
+    located = regions.locate(positions["lon"].to_numpy(), positions["lat"].to_numpy())
+    inside = positions.loc[located >= 0].assign(region=located[located >= 0])
+    if inside.empty:
+        return []
+    inside["hour"] = pd.to_datetime(inside["timestamp"]).dt.floor("1h")
+    return inside.groupby(["region", "hour"])
+
+def region_hourly_updates(positions: pd.DataFrame, regions: RegionIndex) -> list:
+    """
+    $inc of the position count (and $addToSet of the vessels) of every (region, hour) seen in the positions.
+    Only for building the view from scratch: every position must be folded in exactly once.
+    """
+    updates = []
+    for (region, hour), group in region_hour_groups(positions, regions):
+        updates.append(UpdateOne(
+            {"_id": {"region": regions.ids[region], "hour": hour.to_pydatetime()}},
+            {"$set": {"region_name": regions.names[region]},
+             "$inc": {"positions": len(group)},
+             "$addToSet": {"vessel_ids": {"$each": group["vessel_id"].unique().tolist()}}},
+            upsert=True,
+        ))
+    return updates
+
+def region_hour_replacements(hours, positions: pd.DataFrame, regions: RegionIndex) -> list:
+    """
+    Idempotent recount of the given hours from all of their positions: $set of the count and
+    vessels of every (region, hour) with positions, and removal of the regions left without any.
+    Applying it twice, or after a replayed change, gives the same view.
+    """
+    updates, counted = [], {hour: [] for hour in hours}
+    for (region, hour), group in region_hour_groups(positions, regions):
+        hour = hour.to_pydatetime()
+        counted.setdefault(hour, []).append(regions.ids[region])
+        updates.append(UpdateOne(
+            {"_id": {"region": regions.ids[region], "hour": hour}},
+            {"$set": {"region_name": regions.names[region], "positions": len(group),
+                      "vessel_ids": sorted(group["vessel_id"].unique().tolist())}},
+            upsert=True,
+        ))
+    for hour, region_ids in counted.items():
+        updates.append(DeleteMany({"_id.hour": hour, "_id.region": {"$nin": region_ids}}))
+    return updates
+
+def island_centroid_update(document) -> UpdateOne:
+    centroid = shape(document["geometry"]).centroid
+    return UpdateOne(
+        {"_id": document["_id"]},
+        {"$set": {"fid": document.get("fid"), "name": document.get("island_nam"), "centroid": mapping(centroid)}},
+        upsert=True,
+    )
+
+class Maintainer:
+    """
+    Tails one change stream over dynamic_collection, its month partitions and geodata_collection
+    and keeps the materialized views up to date in batches. The resume token is saved after
+    every flushed batch, so a restart continues where the last run stopped.
+
+    Every update is idempotent, so replayed changes (after a crash, or overlapping a rebuild's
+    scan) leave the views unchanged: vessel_latest and the centroids are conditional upserts,
+    and the hours touched by a bucket insert, update or delete are recounted from all of their
+    buckets. Renaming (e.g. a fast reload) or dropping a watched collection, a region change and
+    a delete without a pre-image recompute the whole hourly view. vessel_latest is never moved back.
+    """
+
+    def __init__(self, db, config: dict):
+        self.db = db
+        self.config = config
+        self.views = {name: db[collection] for name, collection in config["views"].items()}
+        self.checkpoints = db[config["checkpoint_collection"]]
+        base = re.escape(config["dynamic_collection"])
+        self.bucket_pattern = re.compile(rf"{base}(_\d{{4}}_\d{{2}})?")
+        self.pre_images = set()
+        self.changed = set()                # views written since their generation was last bumped
+        self.regions = self.load_regions()
+        for name in [config["geodata_collection"]] + self.bucket_collections():
+            self.enable_pre_images(name)
+        # Hours are recounted by timestamp_start (the partitions carry this index already)
+        self.db[config["dynamic_collection"]].create_index([("timestamp_start", ASCENDING)])
+
+    def is_bucket_collection(self, name) -> bool:
+        return bool(self.bucket_pattern.fullmatch(name or ""))
+
+    def bucket_collections(self) -> list:
+        """
+        dynamic_collection and its active month partitions (partitions.py catalog).
+        """
+        base = self.config["dynamic_collection"]
+        active = self.db[partitions.CATALOG].find({"base": base, "state": "active"}, {"_id": 1})
+        return [base] + [partition["_id"] for partition in active]
+
+    def enable_pre_images(self, name):
+        """
+        Record pre-images of the collection's changes (MongoDB 6.0+), so deletes tell which
+        hour or region they affect.
+        """
+        if not self.config.get("pre_images", True) or name in self.pre_images:
+            return
+        self.pre_images.add(name)
+        try:
+            self.db.command("collMod", name, changeStreamPreAndPostImages={"enabled": True})
+        except OperationFailure as e:
+            print(f"No pre-images for {name} (deletes recompute the whole view): {e}")
+
+    def load_regions(self) -> RegionIndex:
+        return RegionIndex.from_collection(self.db[self.config["geodata_collection"]],
+                                           self.config["region_loc_type"], self.config["region_name_field"])
+
+    def resume_token(self):
+        checkpoint = self.checkpoints.find_one({"_id": self.config["checkpoint_id"]})
+        return checkpoint["resume_token"] if checkpoint else None
+
+    def save_checkpoint(self, token):
+        self.checkpoints.update_one(
+            {"_id": self.config["checkpoint_id"]},
+            {"$set": {"resume_token": token, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+
+    def clear_checkpoint(self):
+        self.checkpoints.delete_one({"_id": self.config["checkpoint_id"]})
+
+    def write(self, view, updates):
+        """
+        Bulk-write updates to a view, remembering it as changed when a document actually changed
+        (a replayed recount that $sets the same values leaves the view and its generation alone).
+        """
+        result = self.views[view].bulk_write(updates, ordered=False)
+        if result.upserted_count + result.modified_count + result.deleted_count + result.inserted_count:
+            self.changed.add(view)
+
+    def update_latest(self, positions):
+        if vesselLatest.update_latest(self.views["last_position"], positions):
+            self.changed.add("last_position")
+
+    def bump_changed(self):
+        """
+        Bump the ingestion generation of the views changed since the last call only, so cached
+        results that depend on the other views stay valid.
+        """
+        for view in sorted(self.changed):
+            generations.bump_generation(self.db, self.views[view].name)
+        self.changed.clear()
+
+    def recount_hours(self, hours):
+        """
+        Recount the region/hour view for the given hours from all buckets of those hours.
+        """
+        hours = sorted(hours)
+        projection = {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry.coordinates": 1}
+        with instrumentation.span("mv_region_hourly", hours=len(hours)):
+            for start in range(0, len(hours), self.config["batch_size"]):
+                chunk = hours[start:start + self.config["batch_size"]]
+                buckets = [bucket for name in self.bucket_collections()
+                           for bucket in self.db[name].find({"timestamp_start": {"$in": chunk}}, projection)]
+                updates = region_hour_replacements(chunk, bucket_positions(buckets), self.regions)
+                self.write("region_hourly", updates)
+
+    def rebuild_region_hourly(self, latest=False):
+        """
+        Recompute the whole region/hour view from every bucket collection
+        (with latest=True the same scan also feeds vessel_latest).
+        """
+        self.views["region_hourly"].drop()
+        self.changed.add("region_hourly")
+        with instrumentation.span("mv_region_hourly_rebuild"):
+            for name in self.bucket_collections():
+                batch = []
+                for bucket in self.db[name].find({}, {"vessel_id": 1, "positions": 1}):
+                    batch.append(bucket)
+                    if len(batch) >= self.config["batch_size"]:
+                        self.fold_into_region_hourly(batch, latest)
+                        batch = []
+                self.fold_into_region_hourly(batch, latest)
+
+    def fold_into_region_hourly(self, buckets, latest=False):
+        positions = bucket_positions(buckets)
+        if positions.empty:
+            return
+        if latest:
+            self.update_latest(positions)
+        updates = region_hourly_updates(positions, self.regions)
+        if updates:
+            self.write("region_hourly", updates)
+
+    def rebuild_centroids(self):
+        self.views["island_centroids"].drop()
+        self.changed.add("island_centroids")
+        islands = self.db[self.config["geodata_collection"]].find({"loc_type": "island"})
+        updates = [island_centroid_update(doc) for doc in islands if doc.get("geometry")]
+        if updates:
+            self.write("island_centroids", updates)
+
+    def apply_buckets(self, changes, recount=True) -> bool:
+        """
+        Fold bucket changes into the last-position and region/hour views: new positions feed
+        vessel_latest, and (with recount) every hour a change touched is recounted.
+
+        Returns:
+            bool: True when the whole hourly view must be recomputed instead (a delete without a pre-image).
+        """
+        documents = [change["fullDocument"] for change in changes if change.get("fullDocument")]
+        positions = bucket_positions(documents)
+        if not positions.empty:
+            # Same conditional upserts as the dynamic loader, so both can feed vessel_latest
+            self.update_latest(positions)
+        if not recount:
+            return False
+
+        hours = set()
+        for change in changes:
+            before = change.get("fullDocumentBeforeChange")
+            if change["operationType"] == "delete" and before is None:
+                return True
+            for document in (change.get("fullDocument"), before):
+                if document and document.get("timestamp_start"):
+                    hours.add(document["timestamp_start"])
+        if hours:
+            self.recount_hours(hours)
+        return False
+
+    def apply_geodata(self, changes) -> bool:
+        """
+        Island changes update their centroid.
+
+        Returns:
+            bool: True when a region changed (or a delete without a pre-image may have removed one):
+            the region polygons are reloaded and the hourly view must be recomputed.
+        """
+        updates = []
+        regions_changed = False
+        for change in changes:
+            document = change.get("fullDocument")
+            before = change.get("fullDocumentBeforeChange")
+            if change["operationType"] == "delete":
+                updates.append(DeleteOne({"_id": change["documentKey"]["_id"]}))
+            elif document and document.get("loc_type") == "island" and document.get("geometry"):
+                updates.append(island_centroid_update(document))
+            if change["operationType"] == "delete" and before is None:
+                regions_changed = True
+            elif any((doc or {}).get("loc_type") == self.config["region_loc_type"] for doc in (document, before)):
+                regions_changed = True
+        if updates:
+            self.write("island_centroids", updates)
+        if regions_changed:
+            self.regions = self.load_regions()
+        return regions_changed
+
+    def apply_collection_events(self, events) -> bool:
+        """
+        A watched collection renamed into place (fastLoad.py swap) or dropped (archived partition)
+        changes all of its documents at once: reload what depends on it.
+
+        Returns:
+            bool: True when the hourly view must be recomputed.
+        """
+        geodata = self.config["geodata_collection"]
+        touched = {event["ns"]["coll"] for event in events} | {event.get("to", {}).get("coll") for event in events}
+        existing = set(self.db.list_collection_names())
+        for name in touched:
+            # A collection renamed into place does not carry the pre-image option of the old one
+            self.pre_images.discard(name)
+            if (self.is_bucket_collection(name) or name == geodata) and name in existing:
+                self.enable_pre_images(name)
+        if geodata in touched:
+            self.regions = self.load_regions()
+            self.rebuild_centroids()
+            return True
+        return any(self.is_bucket_collection(name) for name in touched)
+
+    def flush(self, batch, token):
+        with instrumentation.span("mv_batch", changes=len(batch)):
+            geodata_name = self.config["geodata_collection"]
+            documents = [change for change in batch if change["operationType"] in DOCUMENT_OPERATIONS]
+            buckets = [change for change in documents if self.is_bucket_collection(change["ns"]["coll"])]
+            geodata = [change for change in documents if change["ns"]["coll"] == geodata_name]
+            events = [change for change in batch if change["operationType"] in ("rename", "drop")]
+            for change in buckets:
+                self.enable_pre_images(change["ns"]["coll"])    # e.g. a new month partition
+
+            # Geodata first: new regions must be known before their positions are counted
+            recompute = self.apply_geodata(geodata) if geodata else False
+            recompute = self.apply_collection_events(events) or recompute
+            if recompute:
+                # Fold bucket changes into vessel_latest only; the hourly view is recounted in full
+                self.apply_buckets(buckets, recount=False)
+                self.rebuild_region_hourly()
+            elif buckets and self.apply_buckets(buckets):
+                self.rebuild_region_hourly()
+            self.save_checkpoint(token)
+        self.bump_changed()
+
+    def rebuild(self):
+        """
+        Recompute every view from the current collections (first run, or after losing the checkpoint).
+        The change stream is opened first, so changes made during the rebuild are not missed; the
+        ones the scan already saw are replayed harmlessly, since every incremental update is idempotent.
+        """
+        with self.watch(None) as stream:
+            token = stream.resume_token
+            # vessel_latest only ever moves forward (and is shared with the loader): keep it and its index
+            self.rebuild_centroids()
+            self.rebuild_region_hourly(latest=True)
+        self.save_checkpoint(token)
+        self.bump_changed()
+        print("Rebuilt materialized views; following changes from the saved checkpoint")
+
+    def watch(self, token):
+        bucket_pattern = self.bucket_pattern.pattern
+        names = {"$in": [self.config["geodata_collection"]]}
+        watched = {
+            "$or": [{"ns.coll": {"$regex": f"^{bucket_pattern}$"}}, {"ns.coll": names},
+                    {"to.coll": {"$regex": f"^{bucket_pattern}$"}}, {"to.coll": names}],
+            "operationType": {"$in": [*DOCUMENT_OPERATIONS, "rename", "drop"]},
+        }
+        # An invalidate (database dropped or renamed) has no collection: let it through as is
+        pipeline = [{"$match": {"$or": [watched, {"operationType": "invalidate"}]}}]
+        before = "whenAvailable" if self.config.get("pre_images", True) else None
+        return self.db.watch(pipeline, full_document="updateLookup", full_document_before_change=before,
+                             resume_after=token, max_await_time_ms=self.config["max_await_ms"])
+
+    def run(self):
+        """
+        Follow the change stream forever, flushing a batch when it is full or the stream goes idle.
+        An invalidated stream (database dropped or renamed) is restarted from a rebuild.
+        """
+        while True:
+            token = self.resume_token()
+            if token is None:
+                self.rebuild()
+                token = self.resume_token()
+            with self.watch(token) as stream:
+                batch = []
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None and change["operationType"] == "invalidate":
+                        if batch:
+                            self.flush(batch, batch[-1]["_id"])
+                        self.clear_checkpoint()
+                        print("Change stream invalidated; rebuilding the views")
+                        break
+                    if change is not None:
+                        batch.append(change)
+                    if batch and (change is None or len(batch) >= self.config["batch_size"]):
+                        self.flush(batch, stream.resume_token)
+                        print(f"Applied {len(batch)} changes")
+                        batch = []
+                else:
+                    return
+
+def main(config_path="materialized_views/maintainer_config.yaml"):
+    config = load_config(config_path)
+    instrumentation.configure(config.get("trace_path"))
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()])
+    maintainer = Maintainer(client[config["database"]], config)
+    if "--rebuild" in sys.argv:
+        maintainer.rebuild()
+    try:
+        maintainer.run()
+    except KeyboardInterrupt:
+        print("Stopped; the next run resumes from the last checkpoint")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+from datetime import datetime, timezone
+import numpy as np
+import yaml
+import queries
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def drain(cursor) -> int:
+    """
+    Fetch every batch of a cursor and return the number of documents.
+    """
+    return sum(1 for _ in cursor)
+
+def explain_aggregate(db, collection, pipeline) -> dict:
+    return db.command("explain", {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}},
+                      verbosity="executionStats")
+
+def explain_find(db, collection, query_filter, projection=None) -> dict:
+    command = {"find": collection.name, "filter": query_filter}
+    if projection is not None:
+        command["projection"] = projection
+    return db.command("explain", command, verbosity="executionStats")
+
+def plan_stages(plan) -> list:
+    """
+    Stage names of a winning plan, outermost first.
+    """
+    stages = []
+    while isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        if "inputStages" in plan:
+            for input_stage in plan["inputStages"]:
+                stages.extend(plan_stages(input_stage))
+            break
+        plan = plan.get("inputStage") or plan.get("queryPlan")
+    return stages
+
+def execution_summary(explain) -> dict:
+    """
+    Collect keys/docs examined, documents returned and winning plan stages from an explain output.
+    Aggregations report per-stage executionStats (e.g. under $cursor or $geoNearCursor), find reports one.
+    """
+    summary = {"totalKeysExamined": 0, "totalDocsExamined": 0, "nReturned": 0, "executionTimeMillis": 0, "stages": []}
+
+    def visit(node):
+        if isinstance(node, dict):
+            stats = node.get("executionStats")
+            if isinstance(stats, dict):
+                for key in ("totalKeysExamined", "totalDocsExamined", "nReturned", "executionTimeMillis"):
+                    summary[key] += stats.get(key, 0)
+            planner = node.get("queryPlanner")
+            if isinstance(planner, dict):
+                summary["stages"].extend(plan_stages(planner.get("winningPlan")))
+            for value in node.values():
+                if value is not stats and value is not planner:
+                    visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    visit(explain)
+    return summary
+
+def latency_stats(timings) -> dict:
+    """
+    Percentiles (ms) of the repeated runs. The first run is reported apart: it follows the plan
+    cache clear but still hits warm WiredTiger and OS caches, so it is not a cold-cache number.
+    """
+    first, warm = timings[0], np.array(timings[1:] or timings[:1])
+    return {
+        "first_run_ms": round(first, 3),
+        "p50_ms": round(float(np.percentile(warm, 50)), 3),
+        "p95_ms": round(float(np.percentile(warm, 95)), 3),
+        "p99_ms": round(float(np.percentile(warm, 99)), 3),
+        "mean_ms": round(float(warm.mean()), 3),
+        "runs": len(timings),
+    }
+
+def run_case(db, collection, run, repeats, clear_plan_cache) -> dict:
+    """
+    Execute run() `repeats` times; run() must fully consume its results and return the document count.
+    """
+    if clear_plan_cache:
+        db.command("planCacheClear", collection.name)
+
+    timings, returned = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        returned = run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return dict(latency_stats(timings), documents_returned=returned)
+
+def aggregate_case(db, collection, name, params, pipeline, repeats, clear_plan_cache) -> dict:
+    result = run_case(db, collection, lambda: drain(collection.aggregate(pipeline)), repeats, clear_plan_cache)
+    return {"query": name, "params": params, **result,
+            "explain": execution_summary(explain_aggregate(db, collection, pipeline))}
+
+def query4_case(db, params, repeats, clear_plan_cache) -> dict:
+    collection = db.dynamic_collection
+    time_start = datetime.strptime(params["start_time"], "%Y-%m-%dT%H:%M:%S.%f%z")
+    time_end = datetime.strptime(params["end_time"], "%Y-%m-%dT%H:%M:%S.%f%z")
+    filter = queries.query4_filter(time_start, time_end)
+    projection = {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}
+
+    fetched = {}
+    def run():
+        vessels = list(collection.find(filter, projection).batch_size(100))
+        fetched["buckets"] = len(vessels)
+        return len(queries.proximity_pairs(vessels, params["X"]))
+
+    result = run_case(db, collection, run, repeats, clear_plan_cache)
+    return {"query": "query4", "params": params, **result, "buckets_fetched": fetched["buckets"],
+            "explain": execution_summary(explain_find(db, collection, filter, projection))}
+
+def run_benchmark(db, config) -> list:
+    """
+    Run every query over its parameter sweep and return one result dict per parameter set.
+    """
+    repeats = config.get("repeats", 10)
+    clear = config.get("clear_plan_cache", True)
+    results = []
+
+    for params in config.get("query2", []):
+        print(f"Benchmarking query2 {params}")
+        results.append(aggregate_case(db, db.vessels_collection, "query2", params,
+                                      queries.query2_pipeline(**params), repeats, clear))
+
+    sweep = config.get("query3a", {})
+    for radius in sweep.get("radius", []):
+        params = {"point": sweep["point"], "radius": radius}
+        print(f"Benchmarking query3a {params}")
+        results.append(aggregate_case(db, db.dynamic_collection, "query3a", params,
+                                      queries.query3a_pipeline(**params), repeats, clear))
+
+    sweep = config.get("query3b", {})
+    for K in sweep.get("K", []):
+        params = {"K": K, "point": sweep["point"]}
+        print(f"Benchmarking query3b {params}")
+        results.append(aggregate_case(db, db.dynamic_collection, "query3b", params,
+                                      queries.query3b_pipeline(**params), repeats, clear))
+
+    sweep = config.get("query3c", {})
+    centroid_coords = queries.island_centroid(db, sweep["fid"]) if sweep else None
+    for radius in sweep.get("radius", []) if centroid_coords else []:
+        params = {"fid": sweep["fid"], "radius": radius}
+        print(f"Benchmarking query3c {params}")
+        results.append(aggregate_case(db, db.dynamic_collection, "query3c", params,
+                                      queries.query3c_pipeline(centroid_coords, radius), repeats, clear))
+
+    sweep = config.get("query4", {})
+    for X in sweep.get("X", []):
+        for start_time, end_time in sweep.get("time_windows", []):
+            params = {"X": X, "start_time": start_time, "end_time": end_time}
+            print(f"Benchmarking query4 {params}")
+            results.append(query4_case(db, params, repeats, clear))
+
+    return results
+
+def compare(baseline_path: str, current_path: str):
+    """
+    Print the p50/p95 change of every query/parameter set between two benchmark files.
+    """
+    def index(path):
+        with open(path, "r") as file:
+            report = json.load(file)
+        return {(r["query"], json.dumps(r["params"], sort_keys=True)): r for r in report["results"]}
+
+    baseline, current = index(baseline_path), index(current_path)
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]
+        print(f"{key[0]} {key[1]}: p50 {before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms, "
+              f"p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms, "
+              f"docs examined {before['explain']['totalDocsExamined']} -> {result['explain']['totalDocsExamined']}")
+
+def main():
+    config = load_config("run_queries/benchmark_config.yaml")
+    db, client = queries.mongo_connect()
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "server_version": client.server_info()["version"],
+        "indexes": {name: list(db[name].index_information()) for name in
+                    ["vessels_collection", "dynamic_collection", "geodata_collection", "weather_collection"]},
+        "results": run_benchmark(db, config),
+    }
+    client.close()
+
+    output_dir = config.get("output_dir", "run_queries/benchmarks")
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output_path, "w") as file:
+        json.dump(report, file, indent=4, default=str)
+    print(f"Benchmark written to {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+import numpy as np
+import queries
+from queries import instrumentation, documents_output
+
+# Example gates as [lon, lat] polylines (approximate; direction of travel is reported relative
+# to the gate's direction, from its first to its last point)
+GATES = {
+    "piraeus_entrance": [[23.6108, 37.9380], [23.6150, 37.9352]],
+    "saronic_sounio_methana": [[24.0245, 37.6502], [23.3950, 37.6360]],
+}
+
+def crossing_filter(gate, start_time, end_time) -> dict:
+    """
+    Candidate buckets: their track intersects the gate and they overlap [start_time, end_time].
+    """
+    return {
+        "track": {"$geoIntersects": {"$geometry": {"type": "LineString", "coordinates": gate}}},
+        # An hourly bucket starting up to an hour before start_time still overlaps the range
+        "timestamp_start": {"$gt": start_time - timedelta(hours=1), "$lte": end_time},
+    }
+
+def bucket_fixes(buckets):
+    """
+    Fixes of all buckets as flat arrays (bucket index, time in ms, lon, lat), each bucket in time
+    order and starting at its previous_fix (the previous hour's last fix) when there is one.
+    """
+    bucket_index, times, coordinates = [], [], []
+    for index, bucket in enumerate(buckets):
+        fixes = [(position["timestamp"], position["geometry"]["coordinates"]) for position in bucket["positions"]]
+        if bucket.get("previous_fix"):
+            fixes.append((bucket["previous_fix"]["timestamp"], bucket["previous_fix"]["coordinates"]))
+        fixes.sort(key=lambda fix: fix[0])
+        bucket_index.extend([index] * len(fixes))
+        times.extend(fix[0] for fix in fixes)
+        coordinates.extend(fix[1][:2] for fix in fixes)
+    coordinates = np.array(coordinates, dtype=float).reshape(-1, 2)
+    return (np.array(bucket_index), np.array(times, dtype="datetime64[ms]").astype(np.int64),
+            coordinates[:, 0], coordinates[:, 1])
+
+def segment_crossings(bucket_index, times, lon, lat, gate):
+    """
+    Intersections of every track segment (consecutive fixes of one bucket) with every gate segment,
+    vectorized over the track segments. Planar in lon/lat: fine for gates and fix spacing of a few km.
+
+    A fix exactly on the gate line is a crossing only when the vessel leaves to the other side
+    than it came from (touching the line and turning back is not); its direction is the side it leaves to.
+
+    Returns:
+        List[tuple]: (segment start row, crossing time in ms, lon, lat, side) per crossing, where side
+        is +1 when the vessel crosses from the gate's right to its left and -1 the other way.
+    """
+    same_bucket = bucket_index[1:] == bucket_index[:-1]
+    px, py = lon[:-1], lat[:-1]
+    rx, ry = lon[1:] - px, lat[1:] - py
+    crossings = []
+    for (ax, ay), (bx, by) in zip(gate[:-1], gate[1:]):
+        sx, sy = bx - ax, by - ay
+        # Side of every fix relative to the gate direction (cross product): +1 left, -1 right, 0 on the line
+        fix_side = np.sign(sx * (lat - ay) - sy * (lon - ax))
+        denominator = rx * sy - ry * sx
+        qx, qy = ax - px, ay - py
+        with np.errstate(divide="ignore", invalid="ignore"):
+            along_track = (qx * sy - qy * sx) / denominator
+            along_gate = (qx * ry - qy * rx) / denominator
+        # Half-open on the track so a crossing exactly at a fix is counted once
+        hit = same_bucket & (denominator != 0) & (along_track >= 0) & (along_track < 1) & (along_gate >= 0) & (along_gate <= 1)
+        for row in np.flatnonzero(hit):
+            # The vessel leaves to the side of the segment's end (or away from its start, when rounding
+            # puts the end on the line); a segment with both ends on the line does not cross it
+            side = fix_side[row + 1] if fix_side[row + 1] != 0 else -fix_side[row]
+            if side == 0:
+                continue
+            if fix_side[row] == 0:
+                # Starting on the line: compare with the last fix off the line before it (same bucket)
+                previous = row - 1
+                while previous >= 0 and same_bucket[previous] and fix_side[previous] == 0:
+                    previous -= 1
+                if previous >= 0 and same_bucket[previous] and fix_side[previous] == side:
+                    continue
+            fraction = along_track[row]
+            time = times[row] + fraction * (times[row + 1] - times[row])
+            crossings.append((row, time, px[row] + fraction * rx[row], py[row] + fraction * ry[row], side))
+    return crossings
+
+def vessels_crossing(db, gate="piraeus_entrance", start_time=datetime(2017, 11, 6), end_time=datetime(2017, 11, 7),
+                     collection_name="dynamic_collection"):
+    """
+    Vessels that crossed a gate (a name of GATES or a [lon, lat] polyline) between start_time and end_time,
+    with the time, point and direction of every crossing.
+    """
+    gate = GATES[gate] if isinstance(gate, str) else gate
+    print("Executing gate crossings...")
+    with instrumentation.span("query", query="crossings", start_time=start_time, end_time=end_time) as timing:
+        with instrumentation.span("fetch"):
+            buckets = list(db[collection_name].find(
+                crossing_filter(gate, start_time, end_time),
+                {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry.coordinates": 1, "previous_fix": 1},
+            ))
+            instrumentation.count("buckets", len(buckets))
+
+        with instrumentation.span("intersect"):
+            bucket_index, times, lon, lat = bucket_fixes(buckets)
+            start_ms = np.datetime64(start_time.replace(tzinfo=None), "ms").astype(np.int64)
+            end_ms = np.datetime64(end_time.replace(tzinfo=None), "ms").astype(np.int64)
+            documents = [{
+                "vessel_id": buckets[bucket_index[row]]["vessel_id"],
+                "timestamp": datetime(1970, 1, 1) + timedelta(milliseconds=float(time)),
+                "coordinates": [float(x), float(y)],
+                "direction": "right_to_left" if side > 0 else "left_to_right",
+            } for row, time, x, y, side in segment_crossings(bucket_index, times, lon, lat, gate)
+                if start_ms <= time <= end_ms]
+            documents.sort(key=lambda doc: doc["timestamp"])
+            instrumentation.count("documents_returned", len(documents))
+
+    documents_output(documents)
+    print(f"Returned {len(documents)} crossings. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+    return documents
+
+if __name__ == "__main__":
+    instrumentation.configure("traces/crossings.jsonl")
+    db, client = queries.mongo_connect()
+    vessels_crossing(db)
+    client.close()
@@ -0,0 +1,289 @@
+import sys
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import bson
+from bson import json_util, ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+import pyarrow as pa
+import pyarrow.parquet as pq
+import queries
+from queries import instrumentation
+
+# Cursors of these collections yield undecoded documents; batches are decoded at once
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# Declared Arrow schemas of the exportable queries: a schema inferred from the first batch would
+# type a column that is all null there (e.g. heading, speed) as null and reject later values
+POINT = pa.struct([("type", pa.string()), ("coordinates", pa.list_(pa.float64()))])
+POSITION_SCHEMA = pa.schema([
+    ("vessel_id", pa.string()),
+    ("timestamp", pa.timestamp("ms")),
+    ("lon", pa.float64()),
+    ("lat", pa.float64()),
+    ("speed", pa.float64()),
+    ("heading", pa.float64()),
+    ("course", pa.float64()),
+])
+BUCKET_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("vessel_id", pa.string()),
+    ("timestamp_start", pa.timestamp("ms")),
+    ("timestamp_end", pa.timestamp("ms")),
+    ("positions", pa.list_(pa.struct([
+        ("timestamp", pa.timestamp("ms")),
+        ("geometry", POINT),
+        ("speed", pa.float64()),
+        ("heading", pa.float64()),
+        ("course", pa.float64()),
+    ]))),
+    ("previous_fix", pa.struct([("timestamp", pa.timestamp("ms")), ("coordinates", pa.list_(pa.float64()))])),
+    ("track", pa.struct([("type", pa.string()), ("coordinates", pa.list_(pa.list_(pa.float64())))])),
+])
+EXPORT_SCHEMAS = {
+    "positions": POSITION_SCHEMA,
+    "buckets": BUCKET_SCHEMA,
+    "query3c": BUCKET_SCHEMA.append(pa.field("distance", pa.struct([("calculated", pa.float64())]))),
+}
+
+def raw_batches(cursor, batch_size=10000):
+    """
+    Drain a cursor of RawBSONDocument in batches, decoding each batch with one decode_all call.
+    Only one batch is held in memory at a time.
+    """
+    batch = []
+    for raw in cursor:
+        batch.append(raw.raw)
+        if len(batch) == batch_size:
+            yield bson.decode_all(b"".join(batch))
+            batch = []
+    if batch:
+        yield bson.decode_all(b"".join(batch))
+
+def arrow_ready(value):
+    """
+    Replace BSON-only values (ObjectId) by Arrow-compatible ones, recursively.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: arrow_ready(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [arrow_ready(item) for item in value]
+    return value
+
+class ParquetSink:
+    """
+    Write batches of documents to one Parquet file with the given schema
+    (without one, the schema is inferred from the first batch).
+    """
+
+    def __init__(self, path, schema=None, compression="zstd"):
+        self.path, self.schema, self.compression = path, schema, compression
+        self.writer = None
+
+    def write(self, documents):
+        table = pa.Table.from_pylist([arrow_ready(doc) for doc in documents], schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class ArrowSink(ParquetSink):
+    """
+    Write batches of documents to an Arrow IPC file (record batches, no compression).
+    """
+
+    def write(self, documents):
+        batch = pa.RecordBatch.from_pylist([arrow_ready(doc) for doc in documents], schema=self.schema)
+        if self.writer is None:
+            self.schema = batch.schema
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+        self.writer.write_batch(batch)
+
+class NDJSONSink:
+    """
+    Write one Extended JSON document per line.
+    """
+
+    def __init__(self, path, schema=None):
+        self.file = open(path, "w")
+
+    def line(self, document) -> str:
+        return json_util.dumps(document)
+
+    def write(self, documents):
+        self.file.write("".join(self.line(doc) + "\n" for doc in documents))
+
+    def close(self):
+        self.file.close()
+
+class GeoJSONLinesSink(NDJSONSink):
+    """
+    Write one GeoJSON Feature per line: the geometry field as geometry, everything else as properties.
+    Documents without that field get lon/lat columns as a Point.
+    """
+
+    def __init__(self, path, schema=None, geometry_field="geometry"):
+        super().__init__(path)
+        self.geometry_field = geometry_field
+
+    def line(self, document) -> str:
+        properties = dict(document)
+        geometry = properties.pop(self.geometry_field, None)
+        if geometry is None and "lon" in properties and "lat" in properties:
+            geometry = {"type": "Point", "coordinates": [properties.pop("lon"), properties.pop("lat")]}
+        return json_util.dumps({"type": "Feature", "geometry": geometry, "properties": properties})
+
+SINKS = {"parquet": ParquetSink, "arrow": ArrowSink, "ndjson": NDJSONSink, "geojsonl": GeoJSONLinesSink}
+
+def export(cursor, sink, batch_size=10000) -> dict:
+    """
+    Stream a RawBSONDocument cursor into a sink.
+
+    Returns:
+        dict: Documents written and elapsed seconds.
+    """
+    written = 0
+    start = time.time()
+    try:
+        for documents in raw_batches(cursor, batch_size):
+            with instrumentation.span("export_batch", documents=len(documents)):
+                sink.write(documents)
+            written += len(documents)
+    finally:
+        sink.close()
+    return {"documents": written, "seconds": time.time() - start}
+
+def positions_pipeline(time_start, time_end):
+    """
+    Flat rows (one per position) of the buckets in [time_start, time_end]: columnar-friendly exports.
+    """
+    return [
+        {"$match": queries.query4_filter(time_start, time_end)},
+        {"$unwind": "$positions"},
+        {"$match": {"positions.timestamp": {"$gte": time_start, "$lte": time_end}}},
+        {"$project": {
+            "_id": 0,
+            "vessel_id": 1,
+            "timestamp": "$positions.timestamp",
+            "lon": {"$arrayElemAt": ["$positions.geometry.coordinates", 0]},
+            "lat": {"$arrayElemAt": ["$positions.geometry.coordinates", 1]},
+            "speed": "$positions.speed",
+            "heading": "$positions.heading",
+            "course": "$positions.course",
+        }},
+    ]
+
+def export_cursor(db, query, **params):
+    """
+    RawBSONDocument cursor of an exportable query: 'positions' (flat rows in a time range),
+    'buckets' (bucket documents in a time range) or 'query3c' (buckets near an island centroid).
+    """
+    collection = db.dynamic_collection.with_options(codec_options=RAW_OPTIONS)
+    time_start = params.get("time_start", datetime(2017, 11, 6, 8))
+    time_end = params.get("time_end", datetime(2017, 11, 6, 8, 59, 59))
+    if query == "positions":
+        return collection.aggregate(positions_pipeline(time_start, time_end), batchSize=10000, allowDiskUse=True)
+    if query == "buckets":
+        return collection.find(queries.query4_filter(time_start, time_end), batch_size=1000)
+    if query == "query3c":
+        centroid_coords = queries.island_centroid(db, params.get("fid", 1))
+        return collection.aggregate(queries.query3c_pipeline(centroid_coords, params.get("radius", 1000)), batchSize=1000)
+    raise ValueError(f"Unknown export query: {query}")
+
+def export_query(db, query, file_format, path, batch_size=10000, **params) -> dict:
+    sink = SINKS[file_format](path, EXPORT_SCHEMAS.get(query))
+    with instrumentation.span("export", query=query, format=file_format):
+        result = export(export_cursor(db, query, **params), sink, batch_size)
+    result["bytes"] = Path(path).stat().st_size
+    print(f"Exported {result['documents']} documents to {path} ({result['bytes'] / 1e6:.1f} MB) "
+          f"in {result['seconds']:.2f} seconds")
+    return result
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process in MB ('resource' is Unix-only; Windows reports the
+    peak working set through psapi).
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters(cb=ctypes.sizeof(ProcessMemoryCounters))
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 1024 / 1024
+    import resource
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def measure_export(query, file_format, path, batch_size) -> dict:
+    """
+    One benchmark export, run in a fresh process so its peak RSS belongs to this format alone.
+    """
+    instrumentation.configure(None)
+    db, client = queries.mongo_connect()
+    try:
+        result = export_query(db, query, file_format, path, batch_size)
+    finally:
+        client.close()
+    # This process's peak, bounded by the batch size
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def benchmark(query="positions", output_dir="run_queries/benchmarks", batch_size=10000) -> list:
+    """
+    Throughput of every format on the same (large) result: documents/s, MB/s and peak RSS.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for file_format in SINKS:
+        path = output_dir / f"export_{query}.{file_format}"
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(measure_export, query, file_format, str(path), batch_size).result()
+        result.update({
+            "query": query,
+            "format": file_format,
+            "documents_per_s": result["documents"] / result["seconds"] if result["seconds"] else None,
+            "mb_per_s": result["bytes"] / 1e6 / result["seconds"] if result["seconds"] else None,
+        })
+        path.unlink()
+        results.append(result)
+
+    output_path = output_dir / f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results written to {output_path}")
+    return results
+
+def main():
+    instrumentation.configure("traces/export.jsonl")
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark(*sys.argv[2:3])    # every format in its own process
+    elif len(sys.argv) == 4:
+        db, client = queries.mongo_connect()
+        export_query(db, *sys.argv[1:4])  # e.g. positions parquet positions.parquet
+        client.close()
+    else:
+        print("Usage: python run_queries/export.py <positions|buckets|query3c> <parquet|arrow|ndjson|geojsonl> <path>"
+              " | benchmark [query]")
+
+if __name__ == "__main__":
+    main()
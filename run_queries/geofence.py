@@ -0,0 +1,122 @@
+import numpy as np
+import shapely
+from shapely.geometry import shape, mapping
+import queries
+from queries import instrumentation, documents_output
+
+class CoarseArea:
+    """
+    A geodata polygon tested through its simplified copy first: points deeper than `tolerance`
+    inside (or outside) the simplified shape are decided without the exact polygon; only the
+    band of width 2 * tolerance around the boundary is checked exactly.
+    """
+
+    def __init__(self, exact, simplified, tolerance):
+        self.exact = exact
+        self.tolerance = tolerance
+        self.inner = simplified.buffer(-tolerance)
+        # Superset of the exact polygon; mitred corners add fewer vertices than round ones
+        self.outer = simplified.buffer(tolerance, join_style="mitre")
+        for geometry in (self.exact, self.inner, self.outer):
+            shapely.prepare(geometry)
+
+    @classmethod
+    def from_db(cls, db, loc_type, fid, tolerance=0.002):
+        document = db.geodata_collection.find_one({"loc_type": loc_type, "fid": fid})
+        if document is None:
+            raise ValueError(f"No {loc_type} with FID {fid}")
+        simplified = [entry for entry in document.get("geometry_simplified", []) if entry["tolerance"] == tolerance]
+        if not simplified:
+            raise ValueError(f"{loc_type} FID {fid} has no copy simplified at {tolerance} (geo_config simplify_tolerances)")
+        return cls(shape(document["geometry"]), shape(simplified[0]["geometry"]), tolerance)
+
+    def within_filter(self, field="positions.geometry") -> dict:
+        """
+        Server-side prefilter: $geoWithin the (small) outer shape, a superset of the exact polygon.
+        """
+        return {field: {"$geoWithin": {"$geometry": mapping(self.outer)}}}
+
+    def contains(self, lon, lat) -> np.ndarray:
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        inside = shapely.contains_xy(self.inner, lon, lat)
+        near_boundary = ~inside & shapely.contains_xy(self.outer, lon, lat)
+        instrumentation.count("exact_checks", int(near_boundary.sum()))
+        inside[near_boundary] = shapely.contains_xy(self.exact, lon[near_boundary], lat[near_boundary])
+        return inside
+
+class TiledArea:
+    """
+    A geodata polygon tested through its tiles: points in an interior tile are inside;
+    points in a boundary tile are checked against that tile's clipped polygon only.
+    """
+
+    def __init__(self, tiles):
+        self.interior = [shape(tile["geometry"]) for tile in tiles if tile["interior"]]
+        self.boundary = [shape(tile["geometry"]) for tile in tiles if not tile["interior"]]
+        self.interior_tree = shapely.STRtree(self.interior)
+        self.boundary_tree = shapely.STRtree(self.boundary)
+
+    @classmethod
+    def from_db(cls, db, loc_type, fid):
+        tiles = list(db.geodata_tiles.find({"loc_type": loc_type, "parent_fid": fid}, {"interior": 1, "geometry": 1}))
+        if not tiles:
+            raise ValueError(f"{loc_type} FID {fid} has no tiles (geo_config tiles option)")
+        return cls(tiles)
+
+    def contains(self, lon, lat) -> np.ndarray:
+        points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        inside = np.zeros(len(points), dtype=bool)
+        # Interior tiles are cell boxes: a bounding-box hit is a containment hit
+        hits, _ = self.interior_tree.query(points, predicate="intersects")
+        inside[hits] = True
+        # Boundary tiles: exact test against the small clipped polygon of the candidate tiles
+        candidates = np.flatnonzero(~inside)
+        hits, _ = self.boundary_tree.query(points[candidates], predicate="intersects")
+        instrumentation.count("exact_checks", len(hits))
+        inside[candidates[np.unique(hits)]] = True
+        return inside
+
+def positions_inside(buckets, area) -> list:
+    """
+    Keep the positions of each bucket that lie inside the area (vectorized over all positions).
+    """
+    buckets = list(buckets)
+    counts = [len(bucket["positions"]) for bucket in buckets]
+    coordinates = np.array([position["geometry"]["coordinates"][:2] for bucket in buckets for position in bucket["positions"]]
+                           ).reshape(-1, 2)
+    inside = area.contains(coordinates[:, 0], coordinates[:, 1])
+    results, offset = [], 0
+    for bucket, count in zip(buckets, counts):
+        kept = [position for position, keep in zip(bucket["positions"], inside[offset:offset + count]) if keep]
+        offset += count
+        if kept:
+            results.append(dict(bucket, positions=kept))
+    return results
+
+def vessels_in_area(db, loc_type="territorial waters", fid=0, start_time=None, end_time=None, tolerance=0.002, tiled=True):
+    """
+    Buckets (with only their inside positions) of vessels within a large geodata polygon.
+    The server prefilters with the coarse outer shape (and the time range); the exact answer is
+    computed client-side from the tiles (tiled=True) or the simplified copy.
+    """
+    print(f"Executing vessels in area ({loc_type} {fid})...")
+    coarse = CoarseArea.from_db(db, loc_type, fid, tolerance)
+    area = TiledArea.from_db(db, loc_type, fid) if tiled else coarse
+    filter = coarse.within_filter()
+    if start_time and end_time:
+        filter["timestamp_start"] = {"$gte": start_time, "$lte": end_time}
+
+    with instrumentation.span("query", query="vessels_in_area", loc_type=loc_type, fid=fid, tiled=tiled) as timing:
+        buckets = db.dynamic_collection.find(filter, {"vessel_id": 1, "timestamp_start": 1, "positions": 1})
+        results = positions_inside(buckets, area)
+        instrumentation.count("documents_returned", len(results))
+
+    documents_output(results, fetch=2)
+    print(f"Returned {len(results)} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+    return results
+
+if __name__ == "__main__":
+    instrumentation.configure("traces/geofence.jsonl")
+    db, client = queries.mongo_connect()
+    vessels_in_area(db)
+    client.close()
@@ -0,0 +1,433 @@
+import os
+import sys
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import geopandas as gpd
+import yaml
+from shapely.geometry import Polygon
+from geopy.distance import geodesic
+
+# The staging cache and the static vessel parser live next to the loaders
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import staging
+import vesselsParser
+import aisCleaning
+
+EARTH_RADIUS_KM = 6378.1    # Same radius MongoDB uses for spherical ($centerSphere, $geoNear) distances
+HOUR_NS = 3600 * 10**9      # Bucket width of dynamic_collection in nanoseconds
+CELL_SIZE = 0.01            # Grid cell size of the spatial index in degrees
+MAX_CELLS = 250000          # Above this number of cells a radius search falls back to a full scan
+STORE_COLUMNS = ["timestamp", "vessel_code", "lon", "lat", "spatial_order", "cell_keys", "cell_starts", "vessel_ids"]
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def cell_ids(lon, lat, cell_size=CELL_SIZE):
+    """
+    Grid cell id of every (lon, lat) pair.
+    """
+    n_rows = int(np.ceil(180 / cell_size)) + 1
+    col = np.floor((np.asarray(lon) + 180) / cell_size).astype(np.int64)
+    row = np.floor((np.asarray(lat) + 90) / cell_size).astype(np.int64)
+    return col * n_rows + row
+
+def haversine_km(point, lon, lat, radius=EARTH_RADIUS_KM):
+    """
+    Great-circle distance in km from point [lon, lat] to arrays of lon/lat.
+    """
+    lon1, lat1 = np.radians(point[0]), np.radians(point[1])
+    lon2, lat2 = np.radians(lon), np.radians(lat)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def to_ns(value) -> int:
+    """
+    Convert a datetime (naive UTC or tz-aware) to nanoseconds since epoch.
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return timestamp.value
+
+def to_datetime(ns) -> datetime:
+    return pd.Timestamp(int(ns)).to_pydatetime()
+
+def build_track_store(config_path="load_database/dynamic_config.yaml", store_dir="run_queries/offline_store", cell_size=CELL_SIZE):
+    """
+    Build the time-sorted column store and its grid index from the staged AIS files, cleaned
+    with the same 'cleaning' options as the dynamic loader so the answers match the Mongo path.
+
+    Args:
+        config_path: Dynamic loader config listing the CSV files and the staging directory.
+        store_dir: Output directory of the .npy columns.
+        cell_size: Grid cell size of the spatial index in degrees.
+
+    Returns:
+        int: Number of positions in the store.
+    """
+    config = load_config(config_path)
+    staging_dir = config.get("staging_dir") or "load_database/staging"
+
+    timestamps, codes, lons, lats, sources = [], [], [], [], []
+    vessel_index = {}
+    for file_entry in config["files"]:
+        file_path = file_entry["file_path"]
+        if not os.path.exists(file_path):
+            print(f"Skipping missing file: {file_path}")
+            continue
+        path = staging.stage_dynamic(file_path, staging_dir)
+        table = feather.read_table(path, columns=["vessel_id", "timestamp", "lon", "lat", "speed"], memory_map=True)
+        dynamic_df, _ = aisCleaning.clean(table.to_pandas(), **config.get("cleaning", {}))
+
+        # Map the file's vessel ids onto one global code table
+        local_codes, vessel_ids = pd.factorize(dynamic_df["vessel_id"])
+        mapping = np.array([vessel_index.setdefault(v, len(vessel_index)) for v in vessel_ids], dtype=np.int32)
+        codes.append(mapping[local_codes] if len(mapping) else np.empty(0, dtype=np.int32))
+        timestamps.append(dynamic_df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64))
+        lons.append(dynamic_df["lon"].to_numpy(dtype=float))
+        lats.append(dynamic_df["lat"].to_numpy(dtype=float))
+        sources.append(file_path)
+
+    if not sources:
+        raise ValueError("No AIS dynamic files found to build the offline store.")
+
+    # Time-sorted layout
+    timestamp = np.concatenate(timestamps)
+    order = np.argsort(timestamp, kind="stable")
+    columns = {
+        "timestamp": timestamp[order],
+        "vessel_code": np.concatenate(codes)[order],
+        "lon": np.concatenate(lons)[order],
+        "lat": np.concatenate(lats)[order],
+    }
+
+    # Grid index: row numbers sorted by cell, plus the start offset of every occupied cell
+    cells = cell_ids(columns["lon"], columns["lat"], cell_size)
+    spatial_order = np.argsort(cells, kind="stable")
+    cell_keys, cell_starts = np.unique(cells[spatial_order], return_index=True)
+    columns["spatial_order"] = spatial_order
+    columns["cell_keys"] = cell_keys
+    columns["cell_starts"] = np.append(cell_starts, len(cells))
+    columns["vessel_ids"] = np.array(list(vessel_index), dtype=str)
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(store_dir, f"{name}.npy"), values)
+    with open(os.path.join(store_dir, "meta.json"), "w") as file:
+        json.dump({"cell_size": cell_size, "rows": int(len(timestamp)), "sources": sources}, file, indent=4)
+
+    print(f"Built offline store with {len(timestamp)} positions in {store_dir}")
+    return len(timestamp)
+
+class OfflineEngine:
+    """
+    Answers the queries of queries.py from the memory-mapped column store built by build_track_store.
+    """
+
+    def __init__(self, store_dir="run_queries/offline_store",
+                 vessel_config_path="load_database/vessel_config.yaml",
+                 islands_path="load_database/islands/islands.shp"):
+        with open(os.path.join(store_dir, "meta.json"), "r") as file:
+            self.meta = json.load(file)
+        for name in STORE_COLUMNS:
+            setattr(self, name, np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r"))
+        self.cell_size = self.meta["cell_size"]
+        self.vessel_config_path = vessel_config_path
+        self.islands_path = islands_path
+        self._vessels = None
+
+    @property
+    def vessels(self) -> pd.DataFrame:
+        # Static vessel data is small; parse it once on first use
+        if self._vessels is None:
+            config = load_config(self.vessel_config_path)
+            self._vessels = vesselsParser.build_vessel_frame(config["vessel_data_path"], config["type_codes_path"])
+        return self._vessels
+
+    def time_range(self, start_ns, end_ns):
+        """
+        Row range [lo, hi) of positions with start_ns <= timestamp <= end_ns (binary search).
+        """
+        lo = int(np.searchsorted(self.timestamp, start_ns, side="left"))
+        hi = int(np.searchsorted(self.timestamp, end_ns, side="right"))
+        return lo, hi
+
+    def _candidate_rows(self, point, radius_km):
+        """
+        Rows in the grid cells covering the bounding box of the circle, or None for a full scan.
+        """
+        dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+        lat_min, lat_max = point[1] - dlat, point[1] + dlat
+        if lat_min <= -90 or lat_max >= 90:
+            return None
+        dlon = dlat / np.cos(np.radians(max(abs(lat_min), abs(lat_max))))
+        lon_min, lon_max = point[0] - dlon, point[0] + dlon
+        if lon_min < -180 or lon_max > 180:
+            return None
+
+        n_rows = int(np.ceil(180 / self.cell_size)) + 1
+        col_lo, col_hi = np.floor((np.array([lon_min, lon_max]) + 180) / self.cell_size).astype(np.int64)
+        row_lo, row_hi = np.floor((np.array([lat_min, lat_max]) + 90) / self.cell_size).astype(np.int64)
+        if (col_hi - col_lo + 1) * (row_hi - row_lo + 1) > MAX_CELLS:
+            return None
+
+        cols, rows = np.meshgrid(np.arange(col_lo, col_hi + 1), np.arange(row_lo, row_hi + 1), indexing="ij")
+        cells = (cols * n_rows + rows).ravel()
+        pos = np.searchsorted(self.cell_keys, cells)
+        occupied = pos < len(self.cell_keys)
+        pos, cells = pos[occupied], cells[occupied]
+        pos = pos[self.cell_keys[pos] == cells]
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        slices = [self.spatial_order[self.cell_starts[p]:self.cell_starts[p + 1]] for p in pos]
+        return np.sort(np.concatenate(slices))
+
+    def rows_within(self, point, radius_km, time_range=None):
+        """
+        Rows (and their distance in km) within radius_km of point, optionally restricted to a row range.
+        """
+        rows = self._candidate_rows(point, radius_km)
+        if rows is None:
+            lo, hi = time_range if time_range else (0, len(self.timestamp))
+            rows = np.arange(lo, hi)
+        elif time_range:
+            rows = rows[(rows >= time_range[0]) & (rows < time_range[1])]
+        distances = haversine_km(point, self.lon[rows], self.lat[rows])
+        mask = distances <= radius_km
+        return rows[mask], distances[mask]
+
+    def _bucket_keys(self, rows):
+        # One key per (hourly bucket, vessel), as in dynamic_collection
+        hours = self.timestamp[rows] // HOUR_NS
+        return hours * len(self.vessel_ids) + self.vessel_code[rows].astype(np.int64)
+
+    def _nearest_buckets(self, rows, distances):
+        """
+        Closest position per bucket, sorted by distance (the $geoNear semantics on bucket documents).
+        """
+        keys = self._bucket_keys(rows)
+        order = np.lexsort((distances, keys))
+        keys, rows, distances = keys[order], rows[order], distances[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        rows, distances = rows[first], distances[first]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def _geo_near_documents(self, rows, distances):
+        return [{
+            "vessel_id": str(self.vessel_ids[self.vessel_code[row]]),
+            "timestamp_start": to_datetime(self.timestamp[row] // HOUR_NS * HOUR_NS),
+            "distance": {
+                "calculated": float(distance * 1000),
+                "location": {"type": "Point", "coordinates": [float(self.lon[row]), float(self.lat[row])]},
+            },
+        } for row, distance in zip(rows, distances)]
+
+    def query2_vessels_by_country(self, country="Malta", alphanumeric="all"):
+        """
+        Vessels with specific country flag containing a given alphanumeric on ship type description
+        """
+        vessels = self.vessels
+        mask = (vessels["country"] == country) & vessels["description"].str.contains(alphanumeric, case=False, regex=True, na=False)
+        return vessels[mask].to_dict(orient="records")
+
+    def query3a_find_vessels_in_radius(self, point=[23.5057984, 37.7658737], radius=5):
+        """
+        Buckets with at least one position within radius (km) from point, with all their positions
+        """
+        rows, _ = self.rows_within(point, radius)
+        keys = np.unique(self._bucket_keys(rows))
+        n_vessels = len(self.vessel_ids)
+
+        documents = []
+        for hour in np.unique(keys // n_vessels):
+            # All positions of the matched buckets of this hour
+            lo, hi = self.time_range(hour * HOUR_NS, (hour + 1) * HOUR_NS - 1)
+            hour_codes = keys[keys // n_vessels == hour] % n_vessels
+            hour_rows = np.arange(lo, hi)
+            hour_rows = hour_rows[np.isin(self.vessel_code[lo:hi], hour_codes)]
+            codes = self.vessel_code[hour_rows]
+            for code in np.unique(codes):
+                bucket_rows = hour_rows[codes == code]
+                documents.append({
+                    "vessel_id": str(self.vessel_ids[code]),
+                    "timestamp_start": to_datetime(hour * HOUR_NS),
+                    "positions": [{"geometry": {"coordinates": [float(lon), float(lat)]}}
+                                  for lon, lat in zip(self.lon[bucket_rows], self.lat[bucket_rows])],
+                })
+        return sorted(documents, key=lambda doc: (doc["vessel_id"], doc["timestamp_start"]))
+
+    def query3b_K_closest_vessels_to_point(self, K=10, point=[23.3699798, 37.6972956]):
+        """
+        K closest buckets to a given point, searching an expanding radius until K buckets are found
+        """
+        radius = 1.0
+        while True:
+            rows, distances = self.rows_within(point, radius)
+            rows, distances = self._nearest_buckets(rows, distances)
+            # Every bucket closer than the search radius has been seen, so K hits are final
+            if len(rows) >= K or radius > np.pi * EARTH_RADIUS_KM:
+                return self._geo_near_documents(rows[:K], distances[:K])
+            radius *= 4
+
+    def query3c_vessels_near_point(self, centroid_coords, radius=1000):
+        """
+        Buckets within radius (meters) from a point, sorted by distance
+        """
+        rows, distances = self.rows_within(centroid_coords, radius / 1000)
+        return self._geo_near_documents(*self._nearest_buckets(rows, distances))
+
+    def island_centroid(self, fid):
+        """
+        Centroid [lon, lat] of an island's exterior ring, as computed by queries.island_centroid.
+        """
+        islands = gpd.read_file(self.islands_path, encoding="ISO-8859-1")
+        islands.columns = islands.columns.str.lower()
+        match = islands[islands["fid"] == fid]
+        if match.empty or match.geometry.iloc[0].geom_type != "Polygon":
+            return None
+        centroid = Polygon(match.geometry.iloc[0].exterior.coords).centroid
+        return [centroid.x, centroid.y]
+
+    def query3c_vessels_near_island(self, fid=1, radius=1000):
+        """
+        Buckets within radius (meters) from the centroid of an island
+        """
+        centroid_coords = self.island_centroid(fid)
+        if centroid_coords is None:
+            print(f"No polygon island found with FID {fid}.")
+            return []
+        return self.query3c_vessels_near_point(centroid_coords, radius)
+
+    def query4_vessel_proximity_in_time_range(self, X=4000, start_time="2017-11-06T08:00:00.000+00:00", end_time="2017-11-06T08:59:59.000+00:00"):
+        """
+        Vessels with proximity X (meters) at the same timestamp, over all positions of the buckets
+        that have a position in the given time range (the documents the Mongo query fetches)
+        """
+        start_ns = to_ns(datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%f%z"))
+        end_ns = to_ns(datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%f%z"))
+
+        # Buckets with at least one position in the range
+        lo, hi = self.time_range(start_ns, end_ns)
+        keys = np.unique(self._bucket_keys(np.arange(lo, hi)))
+
+        # All positions of those buckets
+        lo, hi = self.time_range(start_ns // HOUR_NS * HOUR_NS, (end_ns // HOUR_NS + 1) * HOUR_NS - 1)
+        rows = np.arange(lo, hi)
+        rows = rows[np.isin(self._bucket_keys(rows), keys)]
+
+        # Rows are time-sorted, so equal timestamps are contiguous
+        timestamps = self.timestamp[rows]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(timestamps)) + 1, [len(rows)]))
+
+        documents = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end - start < 2:
+                continue
+            group = rows[start:end]
+            lon, lat = np.asarray(self.lon[group]), np.asarray(self.lat[group])
+            i, j = np.triu_indices(len(group), 1)
+
+            # Spherical prefilter with a margin for the ellipsoid, then exact geodesic distance
+            a = np.sin(np.radians(lat[j] - lat[i]) / 2) ** 2 + \
+                np.cos(np.radians(lat[i])) * np.cos(np.radians(lat[j])) * np.sin(np.radians(lon[j] - lon[i]) / 2) ** 2
+            approx = 2 * 6371008.8 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+            same = (lon[i] == lon[j]) & (lat[i] == lat[j])
+            candidates = np.flatnonzero((approx < X * 1.01) & ~same)
+
+            timestamp = to_datetime(timestamps[start])
+            for c in candidates:
+                coord1 = [float(lon[i[c]]), float(lat[i[c]])]
+                coord2 = [float(lon[j[c]]), float(lat[j[c]])]
+                distance = geodesic(coord1[::-1], coord2[::-1]).meters
+                if distance < X:
+                    documents.append({
+                        "timestamp": timestamp,
+                        "vessel_1": {"vessel_id": str(self.vessel_ids[self.vessel_code[group[i[c]]]]), "coordinates": coord1},
+                        "vessel_2": {"vessel_id": str(self.vessel_ids[self.vessel_code[group[j[c]]]]), "coordinates": coord2},
+                        "distance(m)": round(distance, 6)
+                    })
+        return documents
+
+def same_geo_near(mongo_docs, offline_docs, tolerance=1.0):
+    """
+    Compare $geoNear results: same vessels and distances within tolerance (meters).
+    """
+    if Counter(doc["vessel_id"] for doc in mongo_docs) != Counter(doc["vessel_id"] for doc in offline_docs):
+        return False
+    mongo_distances = sorted(doc["distance"]["calculated"] for doc in mongo_docs)
+    offline_distances = sorted(doc["distance"]["calculated"] for doc in offline_docs)
+    return bool(np.allclose(mongo_distances, offline_distances, atol=tolerance))
+
+def validate_against_mongo(engine, db, fid=1):
+    """
+    Run each query on MongoDB and offline and report whether the results match.
+    """
+    import queries
+
+    def bucket_key(doc):
+        return doc["vessel_id"], tuple(sorted(tuple(p["geometry"]["coordinates"]) for p in doc["positions"]))
+
+    def pair_key(doc):
+        return doc["timestamp"], frozenset([doc["vessel_1"]["vessel_id"], doc["vessel_2"]["vessel_id"]]), round(doc["distance(m)"], 3)
+
+    results = {}
+    mongo = list(db.vessels_collection.aggregate(queries.query2_pipeline()))
+    results["query2"] = {d["vessel_id"] for d in mongo} == {d["vessel_id"] for d in engine.query2_vessels_by_country()}
+
+    mongo = list(db.dynamic_collection.aggregate(queries.query3a_pipeline()))
+    results["query3a"] = Counter(map(bucket_key, mongo)) == Counter(map(bucket_key, engine.query3a_find_vessels_in_radius()))
+
+    mongo = list(db.dynamic_collection.aggregate(queries.query3b_pipeline()))
+    results["query3b"] = same_geo_near(mongo, engine.query3b_K_closest_vessels_to_point())
+
+    centroid_coords = queries.island_centroid(db, fid)
+    mongo = list(db.dynamic_collection.aggregate(queries.query3c_pipeline(centroid_coords)))
+    results["query3c"] = same_geo_near(mongo, engine.query3c_vessels_near_point(centroid_coords))
+
+    time_start = datetime.strptime("2017-11-06T08:00:00.000+00:00", "%Y-%m-%dT%H:%M:%S.%f%z")
+    time_end = datetime.strptime("2017-11-06T08:59:59.000+00:00", "%Y-%m-%dT%H:%M:%S.%f%z")
+    vessels = db.dynamic_collection.find(queries.query4_filter(time_start, time_end),
+                                         {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1})
+    mongo = queries.proximity_pairs(list(vessels))
+    results["query4"] = Counter(map(pair_key, mongo)) == Counter(map(pair_key, engine.query4_vessel_proximity_in_time_range()))
+
+    for name, matched in results.items():
+        print(f"{name}: {'match' if matched else 'MISMATCH'}")
+    return results
+
+def main():
+    store_dir = "run_queries/offline_store"
+    if not os.path.exists(os.path.join(store_dir, "meta.json")):
+        build_track_store(store_dir=store_dir)
+    engine = OfflineEngine(store_dir)
+
+    for name, query in [("query2", engine.query2_vessels_by_country),
+                        ("query3a", engine.query3a_find_vessels_in_radius),
+                        ("query3b", engine.query3b_K_closest_vessels_to_point),
+                        ("query3c", engine.query3c_vessels_near_island),
+                        ("query4", engine.query4_vessel_proximity_in_time_range)]:
+        start = time.perf_counter()
+        documents = query()
+        end = time.perf_counter()
+        print(f"{name}: {len(documents)} documents in {end - start:.4f} seconds")
+
+    # Cross-check against the MongoDB path when a server is available
+    try:
+        import queries
+        db, client = queries.mongo_connect()
+        validate_against_mongo(engine, db)
+        client.close()
+    except Exception as e:
+        print(f"Skipping validation against MongoDB: {e}")
+
+if __name__ == "__main__":
+    main()
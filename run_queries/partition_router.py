@@ -0,0 +1,119 @@
+import heapq
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import queries
+from queries import instrumentation, documents_output
+from partitions import CATALOG    # load_database is on sys.path via queries
+
+class PartitionRouter:
+    """
+    Routes dynamic_collection queries to the month partitions of the catalog that overlap the
+    query's time range, runs them in parallel and merges their results. Without partitions in
+    the catalog everything goes to the unpartitioned base collection.
+    """
+
+    def __init__(self, db, base="dynamic_collection", max_workers=8):
+        self.db = db
+        self.base = base
+        self.max_workers = max_workers
+
+    def partitions(self, start_time=None, end_time=None) -> list:
+        """
+        Names of the active partitions overlapping [start_time, end_time] (all of them without bounds).
+        """
+        filter = {"base": self.base, "state": "active"}
+        if start_time is not None:
+            filter["end"] = {"$gt": start_time}
+        if end_time is not None:
+            filter["start"] = {"$lte": end_time}
+        names = [partition["_id"] for partition in self.db[CATALOG].find(filter, {"_id": 1}).sort("start", 1)]
+        if not names and self.db[CATALOG].count_documents({"base": self.base}, limit=1) == 0:
+            return [self.base]
+        return names
+
+    def fan_out(self, names, run) -> list:
+        """
+        run(collection) on every partition, in parallel when several are hit; results in partition order.
+        """
+        instrumentation.count("partitions", len(names))
+        if len(names) == 1:
+            return [run(self.db[names[0]])]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(names), 1))) as pool:
+            return list(pool.map(lambda name: run(self.db[name]), names))
+
+    @staticmethod
+    def time_filter(start_time, end_time) -> dict:
+        """
+        Buckets overlapping [start_time, end_time]: an hourly bucket starting up to an hour
+        before start_time still holds positions inside the range.
+        """
+        if start_time is None or end_time is None:
+            return {}
+        return {"timestamp_start": {"$gt": start_time - timedelta(hours=1), "$lte": end_time}}
+
+    def query3a(self, point=[23.5057984, 37.7658737], radius=5, start_time=None, end_time=None) -> list:
+        """
+        Query 3a on the overlapping partitions: results are simply concatenated.
+        """
+        pipeline = queries.query3a_pipeline(point, radius)
+        if start_time is not None and end_time is not None:
+            pipeline[0]["$match"].update(self.time_filter(start_time, end_time))
+        results = self.fan_out(self.partitions(start_time, end_time), lambda collection: list(collection.aggregate(pipeline)))
+        return [doc for documents in results for doc in documents]
+
+    def nearest(self, K, point, start_time=None, end_time=None, max_distance=None) -> list:
+        """
+        K nearest buckets over the overlapping partitions: each partition returns its own K nearest,
+        and the global K nearest are among them, so a K-way merge by distance is exact.
+        """
+        geo_near = {"near": {"type": "Point", "coordinates": point}, "key": "positions.geometry",
+                    "distanceField": "distance.calculated", "includeLocs": "distance.location", "spherical": True,
+                    "query": self.time_filter(start_time, end_time)}
+        if max_distance is not None:
+            geo_near["maxDistance"] = max_distance
+        pipeline = [{"$geoNear": geo_near}, {"$limit": K}, {"$project": {"vessel_id": 1, "timestamp_start": 1, "distance": 1}}]
+        results = self.fan_out(self.partitions(start_time, end_time), lambda collection: list(collection.aggregate(pipeline)))
+        return heapq.nsmallest(K, (doc for documents in results for doc in documents),
+                               key=lambda doc: doc["distance"]["calculated"])
+
+    def query3b(self, K=10, point=[23.3699798, 37.6972956], start_time=None, end_time=None) -> list:
+        return self.nearest(K, point, start_time, end_time)
+
+    def query3c(self, fid=1, radius=1000, start_time=None, end_time=None, K=1000) -> list:
+        """
+        Buckets within radius (meters) from an island centroid, nearest first (at most K).
+        """
+        centroid_coords = queries.island_centroid(self.db, fid)
+        if centroid_coords is None:
+            return []
+        return self.nearest(K, centroid_coords, start_time, end_time, max_distance=radius)
+
+    def query4(self, X=4000, start_time=datetime(2017, 11, 6, 8), end_time=datetime(2017, 11, 6, 8, 59, 59)) -> list:
+        """
+        Query 4 on the overlapping partitions: buckets are fetched in parallel, pairs computed once.
+        """
+        projection = {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}
+        fetch = lambda collection: list(collection.find(queries.query4_filter(start_time, end_time), projection).batch_size(100))
+        vessels = [doc for documents in self.fan_out(self.partitions(start_time, end_time), fetch) for doc in documents]
+        return queries.proximity_pairs(vessels, X)
+
+def main():
+    instrumentation.configure("traces/partition_router.jsonl")
+    db, client = queries.mongo_connect()
+    router = PartitionRouter(db)
+    start_time, end_time = datetime(2017, 11, 6), datetime(2017, 11, 7)
+
+    for name, run in [("query3a", lambda: router.query3a(start_time=start_time, end_time=end_time)),
+                      ("query3b", lambda: router.query3b(start_time=start_time, end_time=end_time)),
+                      ("query3c", lambda: router.query3c(start_time=start_time, end_time=end_time)),
+                      ("query4", lambda: router.query4())]:
+        print(f"\n\n\nRunning routed {name} on {router.partitions(start_time, end_time)}")
+        with instrumentation.span("query", query=name, routed=True) as timing:
+            documents = run()
+            instrumentation.count("documents_returned", len(documents))
+        documents_output(documents)
+        print(f"Returned {len(documents)} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,62 @@
 from pymongo import MongoClient, GEOSPHERE, ASCENDING
-import time
 import json
 import geojson
 from shapely.geometry import Polygon
 from bson import json_util
 import random
+import re
+import yaml
 from datetime import datetime
 from geopy.distance import geodesic
 from collections import defaultdict
+import sys
+from pathlib import Path
 
+# Shared instrumentation lives next to the loaders
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import instrumentation
+from vesselsParser import ngrams, NGRAM_SIZE
+from vessel_dimension import get_vessel_dimension
 
-def mongo_connect():
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def mongo_connect(config_path="run_queries/query_config.yaml"):
     """
-    Connect to the MongoDB instance and return the database and client.
+    Connect to the MongoDB instance configured in query_config.yaml and return the database and client.
     """
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client.mongo_db_project
+    config = load_config(config_path)
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()], **config.get("pool", {}))
+    db = client[config["database"]]
     return db, client
 
 def documents_output(cursor, fetch=5):
     """
-    Print the results of cursor object (fetch size=5)
+    Print the results of cursor object or list (fetch size=5)
     """
     count = 0
-    if cursor.alive:
-        for doc in cursor:
-            print(json_util.dumps(doc, indent=4))
-            count += 1
-            if count == fetch:
-                break
-    else:
+    for doc in cursor:
+        print(json_util.dumps(doc, indent=4))
+        count += 1
+        if count == fetch:
+            break
+    if count == 0:
         print("No documents found!")
 
+def fetch_all(cursor, keep=5):
+    """
+    Drain a cursor so the timing includes every batch; keep the first `keep` documents for output.
+    """
+    documents, returned = [], 0
+    for doc in cursor:
+        if returned < keep:
+            documents.append(doc)
+        returned += 1
+    instrumentation.count("documents_returned", returned)
+    return documents, returned
+
 def explain_query(db, collection, pipeline):
     """
     Explain command
@@ -66,10 +91,26 @@ def ensure_geospatial_index(db):
             print("Geospatial index created successfully.")
         else:
             print("Geospatial index already exists on `positions.geometry`.")
+        # Current-state queries run $geoNear on vessel_latest (no-op when the index exists)
+        db.vessel_latest.create_index([("geometry", GEOSPHERE)])
     except Exception as e:
         print(f"Error creating geospatial index: {e}")
 
 
+def query2_pipeline(country="Malta", alphanumeric="all"):
+    """
+    Aggregation pipeline of query 2 (vessels_collection)
+
+    Plain search terms of at least NGRAM_SIZE characters are looked up through the multikey
+    (country, description_ngrams) index; the regex then only confirms the candidates.
+    """
+    match = {"country": country, # Match the country flag
+             "description": {"$regex": str(".*"+ alphanumeric + ".*"), "$options": "i"}  # Match descriptions contain (.*__ .*) alphanumeric (case-insensitive)
+             }
+    if len(alphanumeric) >= NGRAM_SIZE and re.fullmatch(r"[\w \-]+", alphanumeric):
+        match["description_ngrams"] = {"$all": ngrams(alphanumeric)}
+    return [{"$match": match}]
+
 def query2_vessels_by_country(db, country="Malta", alphanumeric="all"):
     """
     Vessels with specific country flag containing a given alphanumeric on ship type description
@@ -77,23 +118,29 @@ def query2_vessels_by_country(db, country="Malta", alphanumeric="all"):
     print("Executing query 2...")
     collection = db.vessels_collection
     # Aggregate pipeline definition
-    pipeline = [{"$match": {"country": country}}, # Match the country flag
-                {"$match": {"description":
-                                {"$regex": str(".*"+ alphanumeric + ".*"), "$options": "i"}  # Match descriptions contain (.*__ .*) alphanumeric (case-insensitive)
-                                }
-                    }
-                ]
+    pipeline = query2_pipeline(country, alphanumeric)
 
-    # Start timer
-    start = time.time()
-    # Fetch all aggregation results
-    cursor = collection.aggregate(pipeline)
-    # End timer
-    end = time.time()
+    # Fetch all aggregation results (timed until the cursor is exhausted)
+    with instrumentation.span("query", query="query2", country=country, alphanumeric=alphanumeric) as timing:
+        documents, returned = fetch_all(collection.aggregate(pipeline))
 
     # Output the documents
-    documents_output(cursor)
-    print(f"Execution time: {end - start:.4f} seconds")
+    documents_output(documents)
+    print(f"Returned {returned} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+
+def query3a_pipeline(point=[23.5057984, 37.7658737], radius=5):
+    """
+    Aggregation pipeline of query 3a (dynamic_collection), radius in km
+    """
+    return [{"$match": {"positions.geometry": 
+                            {"$geoWithin": 
+                                    {"$centerSphere": [ point, radius/6378.1 ] # Center of circle and radius(km) definition
+                                    }
+                            }
+                        }
+            },
+            {"$project" : {"vessel_id": 1, "positions.geometry.coordinates": 1}}
+            ] 
 
 def query3a_find_vessels_in_radius(db, point=[23.5057984, 37.7658737], radius=5):
     """
@@ -103,26 +150,34 @@ def query3a_find_vessels_in_radius(db, point=[23.5057984, 37.7658737], radius=5)
     collection = db.dynamic_collection
     
     # Pipeline definition
-    pipeline = [{"$match": {"positions.geometry": 
-                                {"$geoWithin": 
-                                        {"$centerSphere": [ point, radius/6378.1 ] # Center of circle and radius(km) definition
-                                        }
-                                }
-                            }
-                },
-                {"$project" : {"vessel_id": 1, "positions.geometry.coordinates": 1}}
-                ] 
+    pipeline = query3a_pipeline(point, radius)
     
     # Fetch results and calculate execution time
-    start = time.time()
-    cursor = collection.aggregate(pipeline)
-    end = time.time()
+    with instrumentation.span("query", query="query3a", point=point, radius=radius) as timing:
+        documents, returned = fetch_all(collection.aggregate(pipeline))
 
     # Output the documents
-    documents_output(cursor)
+    documents_output(documents)
 
     # Execution time
-    print(f"Execution time: {end - start:.4f} seconds")
+    print(f"Returned {returned} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+
+def query3b_pipeline(K=10, point=[23.3699798, 37.6972956]):
+    """
+    Aggregation pipeline of query 3b (dynamic_collection)
+    """
+    return [{"$geoNear":
+                {
+                    "near": {"type": "Point", "coordinates": point},    # Point to calculate distance
+                    "key": "positions.geometry",                        # dynamic_collection also has a 'track' 2dsphere index
+                    "distanceField": "distance.calculated",             # Show the calculated distance on document "distance"
+                    "includeLocs": "distance.location",                 # Show the point that is near to "near" point
+                    "spherical": "True"                                 # Use spherical geometry
+                }
+            },
+                {"$limit": K},
+                {"$project": {"vessel_id": 1, "distance": 1}}           # Get the K closest points only
+            ]
 
 def query3b_K_closest_vessels_to_point(db, K=10, point=[23.3699798, 37.6972956]):
     """
@@ -132,28 +187,63 @@ def query3b_K_closest_vessels_to_point(db, K=10, point=[23.3699798, 37.6972956])
     collection = db.dynamic_collection
 
     # Pipeline definition
-    pipeline = [{"$geoNear":
-                    {
-                        "near": {"type": "Point", "coordinates": point},    # Point to calculate distance
-                        "distanceField": "distance.calculated",             # Show the calculated distance on document "distance"
-                        "includeLocs": "distance.location",                 # Show the point that is near to "near" point
-                        "spherical": "True"                                 # Use spherical geometry
-                    }
-                },
-                    {"$limit": K},
-                    {"$project": {"vessel_id": 1, "distance": 1}}           # Get the K closest points only
-                ]
+    pipeline = query3b_pipeline(K, point)
     
     # Fetch all aggregation results. + Execution time calculation
-    start = time.time()
-    cursor = collection.aggregate(pipeline)
-    end = time.time()
+    with instrumentation.span("query", query="query3b", K=K, point=point) as timing:
+        documents, returned = fetch_all(collection.aggregate(pipeline))
 
-    # Documents output
-    documents_output(cursor)
+    # Documents output, with the vessel's country and type
+    documents_output(get_vessel_dimension(db).annotate_records(documents))
 
     # Execution time
-    print(f"Execution time: {end - start:.4f} seconds")
+    print(f"Returned {returned} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+
+def current_radius_pipeline(point=[23.5057984, 37.7658737], radius=5):
+    """
+    Aggregation pipeline of the current-state radius query (vessel_latest), radius in km
+    """
+    return [{"$match": {"geometry": {"$geoWithin": {"$centerSphere": [point, radius/6378.1]}}}},
+            {"$project": {"_id": 0, "vessel_id": 1, "timestamp": 1, "geometry.coordinates": 1, "speed": 1}}]
+
+def current_vessels_in_radius(db, point=[23.5057984, 37.7658737], radius=5):
+    """
+    Vessels whose latest known position is within radius (km) from point
+    """
+    print("Executing current vessels in radius...")
+    with instrumentation.span("query", query="current_radius", point=point, radius=radius) as timing:
+        documents, returned = fetch_all(db.vessel_latest.aggregate(current_radius_pipeline(point, radius)))
+
+    documents_output(documents)
+    print(f"Returned {returned} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+
+def current_knn_pipeline(K=10, point=[23.3699798, 37.6972956]):
+    """
+    Aggregation pipeline of the current-state K closest vessels query (vessel_latest): one document
+    per vessel, so the K results are K distinct vessels at their latest fix
+    """
+    return [{"$geoNear":
+                {
+                    "near": {"type": "Point", "coordinates": point},
+                    "key": "geometry",
+                    "distanceField": "distance",                        # Meters from point
+                    "spherical": True
+                }
+            },
+            {"$limit": K},
+            {"$project": {"_id": 0, "vessel_id": 1, "timestamp": 1, "geometry.coordinates": 1, "distance": 1}}]
+
+def current_K_closest_vessels_to_point(db, K=10, point=[23.3699798, 37.6972956]):
+    """
+    K closest vessels to a given point, by their latest known position
+    """
+    print("Executing current K closest vessels...")
+    with instrumentation.span("query", query="current_knn", K=K, point=point) as timing:
+        documents, returned = fetch_all(db.vessel_latest.aggregate(current_knn_pipeline(K, point)))
+
+    # Documents output, with the vessel's country and type
+    documents_output(get_vessel_dimension(db).annotate_records(documents))
+    print(f"Returned {returned} documents. Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
 
 def find_islands_with_vessels(db, radius=1000, start_time=None, end_time=None):
     """
@@ -223,6 +313,7 @@ def find_islands_with_vessels(db, radius=1000, start_time=None, end_time=None):
         geo_query = {
             "$geoNear": {
                 "near": {"type": "Point", "coordinates": centroid_coords},
+                "key": "positions.geometry",
                 "distanceField": "distance.calculated",
                 "maxDistance": radius,
                 "spherical": True,
@@ -243,26 +334,27 @@ def find_islands_with_vessels(db, radius=1000, start_time=None, end_time=None):
 
     return islands_with_vessels
 
-def query3c_vessels_near_island(db, fid=1, radius=1000, start_time=None, end_time=None):
+def island_centroid(db, fid):
     """
-    Find vessels within a specified radius from the centroid of an island
-    and return their exact distance from the centroid.
+    Centroid [lon, lat] of the island polygon with the given FID, or None if it cannot be computed.
     """
-    print("Preparing execution of query3c...")
-    island_collection = db.geodata_collection
-    vessel_collection = db.dynamic_collection
+    island_doc = db.geodata_collection.find_one({"loc_type": "island", "fid": fid})
+    return island_doc_centroid(island_doc, fid)
 
-    island_doc = island_collection.find_one({"loc_type": "island", "fid": fid})
+def island_doc_centroid(island_doc, fid):
+    """
+    Centroid [lon, lat] of an island document's polygon, or None if it cannot be computed.
+    """
     if not island_doc:
         print(f"No island found with FID {fid}.")
-        return
+        return None
 
     geometry_type = island_doc['geometry']['type']
     geometry_coordinates = island_doc['geometry']['coordinates']
 
     if geometry_type != "Polygon":
         print("The geometry type of the island is not a Polygon.")
-        return
+        return None
 
     # Close the polygon
     geometry_coordinates[0] = close_polygon(geometry_coordinates[0])
@@ -270,16 +362,19 @@ def query3c_vessels_near_island(db, fid=1, radius=1000, start_time=None, end_tim
     polygon = Polygon(geometry_coordinates[0])
     if not polygon.is_valid:
         print(f"Polygon for island FID {fid} is invalid even after closing.")
-        return
+        return None
 
     centroid = polygon.centroid
-    centroid_coords = [centroid.x, centroid.y]
-
-    print(f"Centroid of island (FID={fid}): {centroid_coords}")
+    return [centroid.x, centroid.y]
 
+def query3c_pipeline(centroid_coords, radius=1000, start_time=None, end_time=None):
+    """
+    Aggregation pipeline of query 3c (dynamic_collection), radius in meters
+    """
     geo_query = {
         "$geoNear": {
             "near": {"type": "Point", "coordinates": centroid_coords},
+            "key": "positions.geometry",
             "distanceField": "distance.calculated",
             "maxDistance": radius,      # In meters
             "spherical": True
@@ -297,14 +392,29 @@ def query3c_vessels_near_island(db, fid=1, radius=1000, start_time=None, end_tim
             }
         }
         pipeline.append(timestamp_filter)
+    return pipeline
 
-    print("Executing query...")
-    start = time.time()
-    cursor = vessel_collection.aggregate(pipeline)
-    end = time.time()
+def query3c_vessels_near_island(db, fid=1, radius=1000, start_time=None, end_time=None):
+    """
+    Find vessels within a specified radius from the centroid of an island
+    and return their exact distance from the centroid.
+    """
+    print("Preparing execution of query3c...")
+    vessel_collection = db.dynamic_collection
+
+    centroid_coords = island_centroid(db, fid)
+    if centroid_coords is None:
+        return
 
-    results = list(cursor)
-    print(f"Query executed in {end - start:.2f} seconds. Found {len(results)} vessel(s).")
+    print(f"Centroid of island (FID={fid}): {centroid_coords}")
+
+    pipeline = query3c_pipeline(centroid_coords, radius, start_time, end_time)
+
+    print("Executing query...")
+    with instrumentation.span("query", query="query3c", fid=fid, radius=radius) as timing:
+        results = list(vessel_collection.aggregate(pipeline))
+        instrumentation.count("documents_returned", len(results))
+    print(f"Query executed in {timing['duration_ms'] / 1000:.2f} seconds. Found {len(results)} vessel(s).")
 
     # Display vessel distances
     vessel_distances = []
@@ -375,6 +485,7 @@ def find_closest_vessels_per_island(db, max_vessels=1, radius_step=1000, max_rad
             geo_query = {
                 "$geoNear": {
                     "near": {"type": "Point", "coordinates": centroid_coords},
+                    "key": "positions.geometry",
                     "distanceField": "distance.calculated",
                     "maxDistance": current_radius,
                     "spherical": True,
@@ -424,19 +535,57 @@ def query4_vessel_proximity_in_time_range(db, X=4000, start_time="2017-11-06T08:
     time_start = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%f%z")
     time_end = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%f%z")
 
-    # Start timer
-    start = time.time()
+    with instrumentation.span("query", query="query4", X=X, start_time=start_time, end_time=end_time) as timing:
+        # Query vessels that have positions within the given time range
+        with instrumentation.span("fetch"):
+            vessels_in_time_range = collection.find(
+                query4_filter(time_start, time_end),
+                {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}
+            ).batch_size(100)
 
-    # Query vessels that have positions within the given time range
-    vessels_in_time_range = collection.find(
-        {"positions.timestamp": {"$gte": time_start, "$lte": time_end}},
-        {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}
-    ).batch_size(100)
+            # Keep the documents on vessels list
+            vessels = list(vessels_in_time_range)
+            instrumentation.count("documents_returned", len(vessels))
+        print(f"Found {len(vessels)} vessels in timerange [{time_start}, {time_end}].")
 
-    # Keep the documents on vessels list
-    vessels = list(vessels_in_time_range)
-    print(f"Found {len(vessels)} vessels in timerange [{time_start}, {time_end}].")
+        with instrumentation.span("proximity"):
+            documents = proximity_pairs(vessels, X)
+            instrumentation.count("pairs", len(documents))
 
+        # Country and type of both vessels of every pair
+        with instrumentation.span("annotate"):
+            documents = get_vessel_dimension(db).annotate_pairs(documents)
+
+    # Output first five documents
+    if documents:
+        count = 0
+        for doc in documents:
+            print(json_util.dumps(doc, indent=2))
+            count += 1
+            if count==5:
+                break
+    else:
+        print("No documents found!")
+    
+    print(f"Execution time: {timing['duration_ms'] / 1000:.4f} seconds")
+
+def query4_filter(time_start, time_end):
+    """
+    Find filter of query 4 (dynamic_collection): buckets with positions in [time_start, time_end]
+    """
+    return {"positions.timestamp": {"$gte": time_start, "$lte": time_end}}
+
+def proximity_pairs(vessels, X=4000):
+    """
+    Pairs of vessels closer than X meters at the same timestamp.
+
+    Args:
+        vessels: Bucket documents with 'vessel_id' and 'positions' (timestamp, geometry).
+        X (int): Proximity threshold in meters.
+
+    Returns:
+        List[dict]: One document per pair with timestamp, both vessels and their distance.
+    """
     # Group positions by timestamp
     timestamp_positions = defaultdict(list)
     for vessel in vessels:
@@ -473,23 +622,11 @@ def query4_vessel_proximity_in_time_range(db, X=4000, start_time="2017-11-06T08:
                         "distance(m)": round(distance,6)
                     }
                     documents.append(location_info)
-    # End timer
-    end = time.time()
-
-    # Output first five documents
-    if documents:
-        count = 0
-        for doc in documents:
-            print(json_util.dumps(doc, indent=2))
-            count += 1
-            if count==5:
-                break
-    else:
-        print("No documents found!")
-    
-    print(f"Execution time: {end - start:.4f} seconds")
+    return documents
 
 def main():
+    # Spans, counters and MongoDB command latencies of this run
+    instrumentation.configure("traces/queries.jsonl")
     db, client = mongo_connect()
     ensure_geospatial_index(db)
 
@@ -500,16 +637,22 @@ def main():
     query3a_find_vessels_in_radius(db)
     print("\n\n\nRunnin query K_closest_vessels_to_point")
     query3b_K_closest_vessels_to_point(db)
+    print("\n\n\nRunnin query current_vessels_in_radius")
+    current_vessels_in_radius(db)
+    print("\n\n\nRunnin query current_K_closest_vessels_to_point")
+    current_K_closest_vessels_to_point(db)
 
     print("\n\n\nRunnin query find_islands_with_vessels")
-    islands_with_vessels = find_islands_with_vessels(db)
+    with instrumentation.span("query", query="find_islands_with_vessels"):
+        islands_with_vessels = find_islands_with_vessels(db)
     fid = islands_with_vessels[0]
 
     print("\n\n\nRunnin query find_vessels_near_island")
     query3c_vessels_near_island(db, fid)
 
     print("\n\n\nRunnin query find_closest_vessels_per_island")
-    closest_vessels = find_closest_vessels_per_island(db)
+    with instrumentation.span("query", query="find_closest_vessels_per_island"):
+        closest_vessels = find_closest_vessels_per_island(db)
     print("Closest vessels per island:")
     for vessel_info in closest_vessels:
         print(vessel_info)
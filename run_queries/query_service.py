@@ -0,0 +1,156 @@
+import time
+import asyncio
+from datetime import datetime
+from pymongo import AsyncMongoClient
+import queries
+from generations import META_COLLECTION    # load_database is on sys.path via queries
+from result_cache import ResultCache
+from vessel_dimension import VesselDimension, VESSEL_FIELDS
+
+class QueryService:
+    """
+    Non-blocking versions of the queries of queries.py on one shared AsyncMongoClient pool.
+    Every query is a coroutine that returns its documents instead of printing them, so a web
+    backend can serve many concurrent requests from a single event loop.
+    """
+
+    def __init__(self, config: dict, cache=None):
+        self.client = AsyncMongoClient(config["mongo_uri"], event_listeners=[queries.instrumentation.command_listener()],
+                                       **config.get("pool", {}))
+        self.db = self.client[config["database"]]
+        self.cache = cache
+        self._dimension = None
+
+    @classmethod
+    def from_config(cls, config_path="run_queries/query_config.yaml"):
+        config = queries.load_config(config_path)
+        cache = ResultCache(**config["cache"]) if config.get("cache") else None
+        return cls(config, cache)
+
+    async def close(self):
+        await self.client.close()
+
+    async def _aggregate(self, collection, pipeline) -> list:
+        cursor = await collection.aggregate(pipeline)
+        return await cursor.to_list()
+
+    async def _cached(self, query, collections, run, **params) -> list:
+        """
+        Serve run(**params) from the result cache while the ingestion generations of the
+        collections it reads are unchanged.
+        """
+        if self.cache is None:
+            return await run(**params)
+        if self.cache.generation_stale():
+            documents = await self.db[META_COLLECTION].find({}, {"generation": 1}).to_list()
+            self.cache.set_generation({doc["_id"]: doc["generation"] for doc in documents})
+        key = self.cache.key(query, **params)
+        hit, value = self.cache.get(key, collections)
+        if hit:
+            return value
+        value = await run(**params)
+        self.cache.put(key, value, collections)
+        return value
+
+    async def vessel_dimension(self, check_interval_s=30) -> VesselDimension:
+        """
+        Shared vessel dimension, reloaded when vessels_collection's ingestion generation changes.
+        """
+        dimension = self._dimension
+        if dimension is not None and time.monotonic() - dimension.checked_at <= check_interval_s:
+            return dimension
+        meta = await self.db[META_COLLECTION].find_one({"_id": "vessels_collection"}) or {}
+        if dimension is None or meta.get("generation") != dimension.generation:
+            cursor = self.db.vessels_collection.find({}, {"_id": 0, "vessel_id": 1, **{field: 1 for field in VESSEL_FIELDS}})
+            dimension = VesselDimension.from_documents(await cursor.to_list(), meta.get("generation"))
+            self._dimension = dimension
+        dimension.checked_at = time.monotonic()
+        return dimension
+
+    async def query2_vessels_by_country(self, country="Malta", alphanumeric="all") -> list:
+        """
+        Vessels with specific country flag containing a given alphanumeric on ship type description
+        """
+        return await self._aggregate(self.db.vessels_collection, queries.query2_pipeline(country, alphanumeric))
+
+    async def query3a_find_vessels_in_radius(self, point=[23.5057984, 37.7658737], radius=5) -> list:
+        """
+        Buckets with positions within radius (km) from point
+        """
+        return await self._cached("query3a", ["dynamic_collection"], self._query3a, point=point, radius=radius)
+
+    async def _query3a(self, point, radius):
+        return await self._aggregate(self.db.dynamic_collection, queries.query3a_pipeline(point, radius))
+
+    async def query3b_K_closest_vessels_to_point(self, K=10, point=[23.3699798, 37.6972956], annotate=False) -> list:
+        """
+        K closest vessels to a given point (with country and type when annotate=True)
+        """
+        documents = await self._cached("query3b", ["dynamic_collection"], self._query3b, K=K, point=point)
+        if annotate:
+            documents = (await self.vessel_dimension()).annotate_records([dict(doc) for doc in documents])
+        return documents
+
+    async def _query3b(self, K, point):
+        return await self._aggregate(self.db.dynamic_collection, queries.query3b_pipeline(K, point))
+
+    async def island_centroid(self, fid):
+        island_doc = await self.db.geodata_collection.find_one({"loc_type": "island", "fid": fid})
+        return queries.island_doc_centroid(island_doc, fid)
+
+    async def query3c_vessels_near_island(self, fid=1, radius=1000, start_time=None, end_time=None) -> list:
+        """
+        Vessels within radius (meters) from the centroid of an island, with their distance
+        """
+        return await self._cached("query3c", ["dynamic_collection", "geodata_collection"], self._query3c, fid=fid, radius=radius, start_time=start_time, end_time=end_time)
+
+    async def _query3c(self, fid, radius, start_time, end_time):
+        centroid_coords = await self.island_centroid(fid)
+        if centroid_coords is None:
+            return []
+        pipeline = queries.query3c_pipeline(centroid_coords, radius, start_time, end_time)
+        # Only the fields the caller needs travel over the wire
+        pipeline.append({"$project": {"vessel_id": 1, "timestamp_start": 1, "distance": 1}})
+        return await self._aggregate(self.db.dynamic_collection, pipeline)
+
+    async def query4_vessel_proximity_in_time_range(self, X=4000, start_time="2017-11-06T08:00:00.000+00:00", end_time="2017-11-06T08:59:59.000+00:00", annotate=False) -> list:
+        """
+        Vessels with proximity X (meters) in given time range (with country and type when annotate=True)
+        """
+        time_start = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%f%z")
+        time_end = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%f%z")
+        cursor = self.db.dynamic_collection.find(
+            queries.query4_filter(time_start, time_end),
+            {"vessel_id": 1, "positions.timestamp": 1, "positions.geometry": 1}
+        ).batch_size(100)
+        vessels = await cursor.to_list()
+        # The pairwise distances are CPU-bound; keep them off the event loop
+        pairs = await asyncio.to_thread(queries.proximity_pairs, vessels, X)
+        if annotate:
+            pairs = (await self.vessel_dimension()).annotate_pairs(pairs)
+        return pairs
+
+async def run_concurrently(service, points, K=10):
+    """
+    Example of concurrent requests: one K-closest query per point, all in flight at once.
+    """
+    return await asyncio.gather(*(service.query3b_K_closest_vessels_to_point(K, point) for point in points))
+
+async def main():
+    service = QueryService.from_config()
+    try:
+        vessels = await service.query2_vessels_by_country()
+        print(f"query2: {len(vessels)} documents")
+
+        points = [[23.3699798, 37.6972956], [23.5057984, 37.7658737], [23.6, 37.9]]
+        results = await run_concurrently(service, points)
+        for point, documents in zip(points, results):
+            print(f"query3b at {point}: {len(documents)} documents")
+
+        pairs = await service.query4_vessel_proximity_in_time_range()
+        print(f"query4: {len(pairs)} pairs")
+    finally:
+        await service.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
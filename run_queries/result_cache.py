@@ -0,0 +1,128 @@
+import os
+import copy
+import json
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+def normalize(value, precision=5):
+    """
+    Canonical form of a query parameter: floats rounded (so nearby points share a key),
+    datetimes as ISO strings, dicts with sorted keys.
+    """
+    if isinstance(value, float):
+        return round(value, precision)
+    if isinstance(value, (list, tuple)):
+        return [normalize(v, precision) for v in value]
+    if isinstance(value, dict):
+        return {k: normalize(value[k], precision) for k in sorted(value)}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of query results with an optional on-disk tier.
+
+    Entries are stored with the ingestion generations (see load_database/generations.py) of the
+    collections their query reads; an entry computed before one of those collections changed, or
+    older than ttl_s seconds, is a miss. Writes to other collections keep it.
+    Values are copied on put and on get, so callers may mutate the results they receive.
+    """
+
+    def __init__(self, max_entries=1024, ttl_s=3600, disk_dir=None, precision=5, generation_check_s=5.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir
+        self.precision = precision
+        self.generation_check_s = generation_check_s
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()       # key -> (generation stamp, expires_at, value)
+        self._generations = None
+        self._generation_checked = 0.0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, query: str, **params) -> str:
+        return json.dumps({"query": query, "params": normalize(params, self.precision)}, sort_keys=True)
+
+    def generation_stale(self) -> bool:
+        """
+        True when the generation should be read again from the database.
+        """
+        return self._generations is None or time.monotonic() - self._generation_checked > self.generation_check_s
+
+    def set_generation(self, generations: dict):
+        """
+        Record the current ingestion generations (e.g. generations.current_generations(db)).
+        """
+        with self._lock:
+            self._generations = dict(generations)
+            self._generation_checked = time.monotonic()
+
+    def generation(self, collections=None) -> str:
+        """
+        Stamp of the current generations of the given collections (all of them when None).
+        """
+        generations = self._generations or {}
+        if collections is not None:
+            generations = {name: generations.get(name) for name in collections}
+        return json.dumps(generations, sort_keys=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def get(self, key, collections=None):
+        """
+        Return (True, value) on a hit, (False, None) on a miss.
+        collections are the collections the query reads, as passed to put.
+        """
+        now = time.time()
+        with self._lock:
+            current = self.generation(collections)
+            entry = self._entries.get(key)
+            if entry is None and self.disk_dir and os.path.exists(self._disk_path(key)):
+                with open(self._disk_path(key), "rb") as file:
+                    entry = pickle.load(file)
+            if entry is not None:
+                generation, expires_at, value = entry
+                if generation == current and expires_at > now:
+                    self._store(key, entry)
+                    self.hits += 1
+                    return True, copy.deepcopy(value)
+                self._discard(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, collections=None):
+        with self._lock:
+            entry = (self.generation(collections), time.time() + self.ttl_s, copy.deepcopy(value))
+            self._store(key, entry)
+            if self.disk_dir:
+                with open(self._disk_path(key), "wb") as file:
+                    pickle.dump(entry, file)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            os.remove(self._disk_path(key))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+            if self.disk_dir:
+                for name in os.listdir(self.disk_dir):
+                    if name.endswith(".pkl"):
+                        os.remove(os.path.join(self.disk_dir, name))
@@ -0,0 +1,108 @@
+import sys
+import time
+import threading
+from pathlib import Path
+import pandas as pd
+
+# Generation counters live next to the loaders
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import generations
+
+VESSEL_FIELDS = ["country", "type_code", "description"]
+
+class VesselDimension:
+    """
+    Columnar copy of vessels_collection keyed by vessel_id, for vectorized joins onto query results.
+    'generation' is the ingestion generation of vessels_collection the table was loaded at.
+    """
+
+    def __init__(self, table: pd.DataFrame, generation=None):
+        self.table = table
+        self.generation = generation
+        self.checked_at = time.monotonic()
+
+    @classmethod
+    def from_documents(cls, documents, generation=None):
+        table = pd.DataFrame(list(documents), columns=["vessel_id"] + VESSEL_FIELDS)
+        table = table.drop_duplicates("vessel_id").set_index("vessel_id")
+        # Few distinct values: categoricals keep the table compact
+        table["country"] = table["country"].astype("category")
+        table["description"] = table["description"].astype("category")
+        table["type_code"] = pd.to_numeric(table["type_code"], errors="coerce").astype("Int64")
+        return cls(table, generation)
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, vessel_ids) -> pd.DataFrame:
+        """
+        Vessel fields for an array of vessel ids (NaN for unknown ids), in the same order.
+        """
+        positions = self.table.index.get_indexer(pd.Index(vessel_ids))
+        # Unknown ids (-1) are not row labels: reindex takes rows only for positions >= 0 and
+        # leaves the others missing, also when the table is empty; column dtypes are kept
+        return self.table.reset_index(drop=True).reindex(positions).reset_index(drop=True)
+
+    def annotate(self, frame: pd.DataFrame, on="vessel_id", prefix="") -> pd.DataFrame:
+        """
+        Return a copy of frame with the vessel fields of column `on` added (e.g. prefix="vessel_1_").
+        """
+        fields = self.lookup(frame[on].to_numpy())
+        fields.columns = [prefix + column for column in fields.columns]
+        fields.index = frame.index
+        return pd.concat([frame, fields], axis=1)
+
+    def lookup_records(self, vessel_ids) -> list:
+        """
+        Vessel fields as plain dicts (None for missing values), ready to merge into documents.
+        """
+        fields = self.lookup(vessel_ids).astype(object)
+        return fields.where(fields.notna(), None).to_dict(orient="records")
+
+    def annotate_records(self, records, on="vessel_id") -> list:
+        """
+        Add the vessel fields to every result document (e.g. query 3b results), in place.
+        """
+        records = list(records)
+        fields = self.lookup_records([record.get(on) for record in records])
+        for record, values in zip(records, fields):
+            record.update(values)
+        return records
+
+    def annotate_pairs(self, pairs) -> list:
+        """
+        Add the vessel fields to both vessels of every query 4 pair document, in place.
+        """
+        pairs = list(pairs)
+        for side in ("vessel_1", "vessel_2"):
+            fields = self.lookup_records([pair[side]["vessel_id"] for pair in pairs])
+            for pair, values in zip(pairs, fields):
+                pair[side].update(values)
+        return pairs
+
+# One dimension per database, shared by the whole process
+_dimensions = {}
+_lock = threading.Lock()
+
+def load_vessel_dimension(db, collection_name="vessels_collection") -> VesselDimension:
+    generation = generations.current_generations(db).get(collection_name)
+    documents = db[collection_name].find({}, {"_id": 0, "vessel_id": 1, **{field: 1 for field in VESSEL_FIELDS}})
+    return VesselDimension.from_documents(documents, generation)
+
+def get_vessel_dimension(db, collection_name="vessels_collection", check_interval_s=30) -> VesselDimension:
+    """
+    Process-wide vessel dimension, reloaded when a vesselsParser load bumps the collection's generation.
+    The generation is checked at most every check_interval_s seconds.
+    """
+    key = (db.name, collection_name)
+    with _lock:
+        dimension = _dimensions.get(key)
+        if dimension is None:
+            dimension = _dimensions[key] = load_vessel_dimension(db, collection_name)
+        elif time.monotonic() - dimension.checked_at > check_interval_s:
+            generation = generations.current_generations(db).get(collection_name)
+            if generation != dimension.generation:
+                dimension = _dimensions[key] = load_vessel_dimension(db, collection_name)
+            else:
+                dimension.checked_at = time.monotonic()
+        return dimension
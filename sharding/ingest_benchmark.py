@@ -0,0 +1,51 @@
+import sys
+import json
+from datetime import datetime
+from pathlib import Path
+from pymongo import MongoClient
+import yaml
+import local_cluster
+import setup_sharding
+import shardedLoader
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def run(config, shards, files=None) -> dict:
+    """
+    Ingest throughput of a fresh local cluster with the given number of shards.
+    """
+    local_cluster.stop(config)
+    local_cluster.start(config, shards)
+    client = MongoClient(config["mongo_uri"])
+    try:
+        setup_sharding.setup(client, config)
+        result = shardedLoader.load(client, config, files)
+    finally:
+        client.close()
+        local_cluster.stop(config)
+    return {"shards": shards, "shard_key_mode": config["shard_key_mode"], **result}
+
+def main(config_path="sharding/shard_profile.yaml"):
+    config = load_config(config_path)
+    # Optional number of dynamic files to load per run (default: all of dynamic_config.yaml)
+    files = None
+    if len(sys.argv) > 1:
+        files = shardedLoader.load_config(config["dynamic_config_path"])["files"][:int(sys.argv[1])]
+
+    results = [run(config, shards, files) for shards in config["benchmark_shards"]]
+    for result in results:
+        print(f"{result['shards']} shard(s): {result['documents']} documents, "
+              f"{result['insert_s']:.2f} s, {result['documents_per_s'] or 0:.0f} documents/s, "
+              f"{result['failed']} rejected")
+
+    output_dir = Path("sharding/benchmarks")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"ingest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results written to {output_path}")
+
+if __name__ == "__main__":
+    main()
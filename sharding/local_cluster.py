@@ -0,0 +1,133 @@
+import sys
+import time
+import shutil
+import subprocess
+from pathlib import Path
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError
+import yaml
+
+# Processes started by this interpreter (stopped and reaped by stop())
+PROCESSES = []
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def wait_for(port, timeout_s=60, process=None) -> MongoClient:
+    """
+    Client connected directly to the process on port, once it accepts connections
+    (fails early when the given process has already exited, e.g. on a bad option).
+    """
+    client = MongoClient(f"mongodb://localhost:{port}/", directConnection=True, serverSelectionTimeoutMS=1000)
+    deadline = time.time() + timeout_s
+    while True:
+        try:
+            client.admin.command("ping")
+            return client
+        except ServerSelectionTimeoutError:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{process.args[0]} on port {port} exited with code {process.returncode}")
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+def initiate_replica_set(port, name, configsvr=False, process=None):
+    """
+    Turn a freshly started mongod into a single-member replica set and wait for it to become primary.
+    """
+    client = wait_for(port, process=process)
+    config = {"_id": name, "members": [{"_id": 0, "host": f"localhost:{port}"}]}
+    if configsvr:
+        config["configsvr"] = True
+    client.admin.command("replSetInitiate", config)
+    while not client.admin.command("hello").get("isWritablePrimary"):
+        time.sleep(0.5)
+    client.close()
+
+def spawn(command) -> subprocess.Popen:
+    """
+    Start a server process in the background. --fork is Unix-only, so the process is started
+    detached instead (its own session, or process group on Windows) and outlives this script.
+    """
+    if sys.platform == "win32":
+        options = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS}
+    else:
+        options = {"start_new_session": True}
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, **options)
+    PROCESSES.append(process)
+    return process
+
+def start_mongod(cluster, name, port, role) -> subprocess.Popen:
+    data_dir = Path(cluster["base_dir"]) / name
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return spawn([cluster["mongod_path"], role, "--replSet", name, "--port", str(port),
+                  "--dbpath", str(data_dir), "--bind_ip", "localhost",
+                  "--logpath", str(data_dir / "mongod.log")])
+
+def start(config, shards=3):
+    """
+    Start a config server, `shards` single-node shard replica sets and a mongos on localhost.
+    """
+    cluster = config["cluster"]
+    process = start_mongod(cluster, "config", cluster["config_port"], "--configsvr")
+    initiate_replica_set(cluster["config_port"], "config", configsvr=True, process=process)
+
+    for i in range(shards):
+        port = cluster["shard_base_port"] + i
+        process = start_mongod(cluster, f"shard{i}", port, "--shardsvr")
+        initiate_replica_set(port, f"shard{i}", process=process)
+
+    log_path = Path(cluster["base_dir"]) / "mongos.log"
+    process = spawn([cluster["mongos_path"], "--configdb", f"config/localhost:{cluster['config_port']}",
+                     "--port", str(cluster["mongos_port"]), "--bind_ip", "localhost",
+                     "--logpath", str(log_path)])
+
+    client = wait_for(cluster["mongos_port"], process=process)
+    for i in range(shards):
+        client.admin.command("addShard", f"shard{i}/localhost:{cluster['shard_base_port'] + i}", name=f"shard{i}")
+    print(f"Cluster with {shards} shards up, mongos on port {cluster['mongos_port']}")
+    client.close()
+
+def stop(config, remove_data=True):
+    """
+    Shut down mongos, shards and config server (in that order) and optionally delete their data.
+    """
+    cluster = config["cluster"]
+    base_dir = Path(cluster["base_dir"])
+    ports = [cluster["mongos_port"]]
+    ports += [cluster["shard_base_port"] + i for i in range(len(list(base_dir.glob("shard*"))))]
+    ports.append(cluster["config_port"])
+    for port in ports:
+        client = MongoClient(f"mongodb://localhost:{port}/", directConnection=True, serverSelectionTimeoutMS=2000)
+        try:
+            client.admin.command("shutdown", force=True)
+        except Exception:
+            pass    # the connection drops when the process exits (or it was not running)
+        finally:
+            client.close()
+    # Reap the processes this interpreter started (the data files are released once they exit)
+    while PROCESSES:
+        process = PROCESSES.pop()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    if remove_data:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    print("Cluster stopped")
+
+def main(config_path="sharding/shard_profile.yaml"):
+    config = load_config(config_path)
+    command = sys.argv[1] if len(sys.argv) > 1 else "start"
+    if command == "start":
+        start(config, int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+    elif command == "stop":
+        stop(config)
+    else:
+        print("Usage: python sharding/local_cluster.py start [shards] | stop")
+
+if __name__ == "__main__":
+    main()
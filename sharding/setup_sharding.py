@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+from bson.min_key import MinKey
+from pymongo import MongoClient
+import yaml
+
+# Typed (cached) parsing of the dynamic files lives next to the loaders
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import staging
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def shard_key(config) -> dict:
+    return {field: direction for field, direction in config["shard_keys"][config["shard_key_mode"]]}
+
+def presplit_points(config) -> list:
+    """
+    vessel_id split points dividing the sample file's vessels into presplit_chunks equal groups.
+    The sample is read through the dynamic loader's staging cache (its staging_dir).
+    """
+    staging_dir = load_config(config["dynamic_config_path"]).get("staging_dir")
+    sample = staging.load_dynamic(config["presplit_sample_file"], staging_dir)
+    vessel_ids = sorted(sample["vessel_id"].unique())
+    chunks = config["presplit_chunks"]
+    return sorted({vessel_ids[len(vessel_ids) * i // chunks] for i in range(1, chunks)})
+
+def key_bound(vessel_id, key) -> dict:
+    """
+    Shard key value at the start of a vessel_id: every other key field at MinKey.
+    """
+    return {field: vessel_id if field == "vessel_id" else MinKey() for field in key}
+
+def distribute_chunks(client, namespace, shards):
+    """
+    Move the pre-split chunks round-robin over the shards (instead of waiting for the balancer).
+    """
+    config_db = client.config
+    collection_info = config_db.collections.find_one({"_id": namespace})
+    chunks = list(config_db.chunks.find({"$or": [{"ns": namespace}, {"uuid": collection_info.get("uuid")}]}).sort("min", 1))
+    for i, chunk in enumerate(chunks):
+        target = shards[i % len(shards)]
+        if chunk["shard"] != target:
+            client.admin.command("moveChunk", namespace, bounds=[chunk["min"], chunk["max"]], to=target)
+    print(f"Distributed {len(chunks)} chunks over {len(shards)} shards")
+
+def setup(client, config):
+    """
+    Shard the (empty) collection with the profile's key, pre-split it and assign zones.
+    """
+    database, namespace = config["database"], f"{config['database']}.{config['collection']}"
+    key = shard_key(config)
+    shards = [shard["_id"] for shard in client.config.shards.find({}, {"_id": 1}).sort("_id", 1)]
+
+    client.admin.command("enableSharding", database)
+    if config["shard_key_mode"] == "hashed":
+        # Hashed keys are pre-split by the server at shardCollection time
+        client.admin.command("shardCollection", namespace, key=key,
+                             numInitialChunks=max(config["presplit_chunks"], len(shards)))
+        print(f"Sharded {namespace} on {key}")
+        return
+
+    client.admin.command("shardCollection", namespace, key=key)
+    points = presplit_points(config)
+    for vessel_id in points:
+        client.admin.command("split", namespace, middle=key_bound(vessel_id, key))
+    print(f"Sharded {namespace} on {key}, pre-split at {len(points)} vessel_id points")
+    distribute_chunks(client, namespace, shards)
+
+    for zone in config.get("zones") or []:
+        client.admin.command("addShardToZone", zone["shard"], zone=zone["name"])
+        client.admin.command("updateZoneKeyRange", namespace, min=key_bound(zone["min"], key),
+                             max=key_bound(zone["max"], key), zone=zone["name"])
+        print(f"Zone {zone['name']}: vessel_id [{zone['min']}, {zone['max']}) on {zone['shard']}")
+
+def main(config_path="sharding/shard_profile.yaml"):
+    config = load_config(config_path)
+    client = MongoClient(config["mongo_uri"])
+    setup(client, config)
+    client.close()
+
+if __name__ == "__main__":
+    main()
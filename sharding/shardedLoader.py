@@ -0,0 +1,168 @@
+import sys
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from bson.min_key import MinKey
+from bson.max_key import MaxKey
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+import yaml
+
+# The regular dynamic loader does parsing and bucketing
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import staging
+import instrumentation
+import generations
+import vesselLatest
+import dynamicParser
+import aisCleaning
+from setup_sharding import shard_key
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, "r") as file:
+        return yaml.safe_load(file)
+
+def sort_key(values) -> tuple:
+    """
+    Comparable form of a shard key value: MinKey below and MaxKey above every value of the field.
+    """
+    return tuple((0, None) if isinstance(value, MinKey) else (2, None) if isinstance(value, MaxKey) else (1, value)
+                 for value in values)
+
+class ChunkMap:
+    """
+    The collection's chunk ranges (from config.chunks) and their shards, for client-side routing.
+    """
+
+    def __init__(self, chunks, fields):
+        chunks = sorted(chunks, key=lambda chunk: sort_key(chunk["min"][field] for field in fields))
+        self.fields = fields
+        self.bounds = [sort_key(chunk["min"][field] for field in fields) for chunk in chunks]
+        self.shards = [chunk["shard"] for chunk in chunks]
+
+    @classmethod
+    def from_cluster(cls, client, namespace, fields):
+        collection_info = client.config.collections.find_one({"_id": namespace}) or {}
+        chunks = client.config.chunks.find({"$or": [{"ns": namespace}, {"uuid": collection_info.get("uuid")}]})
+        return cls(list(chunks), fields)
+
+    def locate(self, values) -> int:
+        """
+        Index of the chunk owning a shard key value.
+        """
+        return bisect_right(self.bounds, sort_key(values)) - 1
+
+def hashed_values(db, vessel_ids, batch_size=10000) -> dict:
+    """
+    Hashed shard key value of every vessel id, computed by the server ($toHashedIndexKey).
+    """
+    hashes = {}
+    vessel_ids = list(vessel_ids)
+    for start in range(0, len(vessel_ids), batch_size):
+        cursor = db.aggregate([
+            {"$documents": [{"v": vessel_id} for vessel_id in vessel_ids[start:start + batch_size]]},
+            {"$project": {"_id": 0, "v": 1, "h": {"$toHashedIndexKey": "$v"}}},
+        ])
+        hashes.update({doc["v"]: doc["h"] for doc in cursor})
+    return hashes
+
+def group_by_chunk(db, documents, chunk_map, hashed=False) -> dict:
+    """
+    Documents grouped by target shard, in chunk order, so every insert batch goes to one shard
+    and mostly to one chunk.
+    """
+    if hashed:
+        hashes = hashed_values(db, {doc["vessel_id"] for doc in documents})
+        keys = [(hashes[doc["vessel_id"]],) for doc in documents]
+    else:
+        keys = [tuple(doc[field] for field in chunk_map.fields) for doc in documents]
+    chunk_of = [chunk_map.locate(key) for key in keys]
+    by_shard = defaultdict(list)
+    for index in sorted(range(len(documents)), key=chunk_of.__getitem__):
+        by_shard[chunk_map.shards[chunk_of[index]]].append(documents[index])
+    return by_shard
+
+def insert_shard_batches(collection, documents, batch_size) -> int:
+    """
+    Insert one shard's documents in unordered batches. A rejected document (e.g. a duplicate _id)
+    only fails itself: the error is printed and the rest of the batch and the load continue.
+
+    Returns:
+        int: Number of documents inserted (fewer than len(documents) when some were rejected).
+    """
+    inserted = 0
+    for start in range(0, len(documents), batch_size):
+        try:
+            result = collection.insert_many(documents[start:start + batch_size], ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            print(f"An error occurred during insertion: {e}")
+            # An unordered bulk insert still reports how many documents made it
+            inserted += e.details.get("nInserted", 0)
+    return inserted
+
+def load(client, config, files=None) -> dict:
+    """
+    Load the dynamic files into the sharded collection, one parallel insert stream per shard.
+
+    Returns:
+        dict: Documents inserted, documents rejected, files with rejected documents,
+        insert time (seconds) and documents per second.
+    """
+    dynamic_config = dynamicParser.load_config(config["dynamic_config_path"])
+    db = client[config["database"]]
+    collection = db[config["collection"]]
+    namespace = f"{config['database']}.{config['collection']}"
+    fields = list(shard_key(config))
+    hashed = config["shard_key_mode"] == "hashed"
+
+    inserted, failed, failed_files, insert_s = 0, 0, [], 0.0
+    for file_entry in files or dynamic_config["files"]:
+        file_path = file_entry["file_path"]
+        print(f"Processing file: {file_path}")
+        with instrumentation.span("file", file=file_path):
+            with instrumentation.span("parse"):
+                dynamic_df = staging.load_dynamic(file_path, dynamic_config.get("staging_dir"))
+            with instrumentation.span("clean"):
+                dynamic_df, _ = aisCleaning.clean(dynamic_df, **dynamic_config.get("cleaning", {}))
+            latest = db[dynamic_config.get("latest_collection", vesselLatest.COLLECTION)]
+            with instrumentation.span("bucket"):
+                previous_fixes = vesselLatest.previous_fixes(latest, dynamic_df["vessel_id"].unique().tolist())
+                documents = dynamicParser.create_hourly_buckets(dynamic_df, previous_fixes=previous_fixes)
+
+            # Chunks move (balancer, splits): route with a fresh map per file
+            with instrumentation.span("route"):
+                chunk_map = ChunkMap.from_cluster(client, namespace, fields)
+                by_shard = group_by_chunk(db, documents, chunk_map, hashed)
+
+            start = time.time()
+            with instrumentation.span("insert", shards=len(by_shard)):
+                with ThreadPoolExecutor(max_workers=max(len(by_shard), 1)) as pool:
+                    counts = pool.map(lambda batch: insert_shard_batches(collection, batch, config["batch_size"]),
+                                      by_shard.values())
+                    file_inserted = sum(counts)
+            inserted += file_inserted
+            if file_inserted < len(documents):
+                failed += len(documents) - file_inserted
+                failed_files.append(file_path)
+            insert_s += time.time() - start
+
+            vesselLatest.update_latest(latest, dynamic_df)
+        generations.bump_generation(db, collection.name)
+
+    print(f"Inserted {inserted} documents in {insert_s:.2f} seconds"
+          + (f"; {failed} rejected in {failed_files}" if failed else ""))
+    return {"documents": inserted, "failed": failed, "failed_files": failed_files, "insert_s": insert_s,
+            "documents_per_s": inserted / insert_s if insert_s else None}
+
+def main(config_path="sharding/shard_profile.yaml"):
+    config = load_config(config_path)
+    instrumentation.configure("traces/load_sharded.jsonl")
+    client = MongoClient(config["mongo_uri"], event_listeners=[instrumentation.command_listener()])
+    load(client, config)
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import aisCleaning
+
+def track(lons, vessel_id="237000001", speeds=None):
+    """
+    One vessel's fixes a minute apart along a parallel (0.001 degrees is about 90 m).
+    """
+    return pd.DataFrame({
+        "vessel_id": vessel_id,
+        "timestamp": pd.date_range("2017-11-06 08:00", periods=len(lons), freq="1min"),
+        "lon": lons,
+        "lat": 37.9,
+        "speed": speeds if speeds is not None else 5.0,
+        "heading": 90.0,
+        "course": 90.0,
+    })
+
+def test_interior_spike_is_removed():
+    df, report = aisCleaning.clean(track([23.0, 23.001, 24.0, 23.003, 23.004]))
+    assert df["lon"].tolist() == [23.0, 23.001, 23.003, 23.004]
+    assert report["speed_outliers"] == 1
+
+def test_spike_next_to_first_fix_keeps_the_first_fix():
+    df, report = aisCleaning.clean(track([23.0, 24.0, 23.002, 23.003, 23.004]))
+    assert df["lon"].tolist() == [23.0, 23.002, 23.003, 23.004]
+    assert report["speed_outliers"] == 1
+
+def test_spike_next_to_last_fix_keeps_the_last_fix():
+    df, report = aisCleaning.clean(track([23.0, 23.001, 23.002, 24.0, 23.004]))
+    assert df["lon"].tolist() == [23.0, 23.001, 23.002, 23.004]
+    assert report["speed_outliers"] == 1
+
+def test_spike_at_an_endpoint_is_removed():
+    df, report = aisCleaning.clean(track([24.0, 23.001, 23.002, 23.003, 23.004]))
+    assert df["lon"].tolist() == [23.001, 23.002, 23.003, 23.004]
+    df, report = aisCleaning.clean(track([23.0, 23.001, 23.002, 23.003, 24.0]))
+    assert df["lon"].tolist() == [23.0, 23.001, 23.002, 23.003]
+    assert report["speed_outliers"] == 1
+
+def test_two_fix_vessel_with_one_jump_keeps_both_fixes():
+    df, report = aisCleaning.clean(track([23.0, 24.0]))
+    assert df["lon"].tolist() == [23.0, 24.0]
+    assert report["speed_outliers"] == 0
+
+def test_jump_between_vessels_is_not_a_spike():
+    df, report = aisCleaning.clean(pd.concat([track([23.0, 23.001]), track([24.0, 24.001], vessel_id="237000002")]))
+    assert len(df) == 4
+    assert report["speed_outliers"] == 0
+
+def test_speed_not_available_keeps_the_fix():
+    df, report = aisCleaning.clean(track([23.0, 23.001, 23.002], speeds=[5.0, 102.3, 5.0]))
+    assert len(df) == 3
+    assert np.isnan(df["speed"].iloc[1])
+    assert report["speed_not_available"] == 1
+    assert report["out_of_range"] == 0
+
+def test_spike_mask_on_sorted_arrays():
+    lon = np.array([23.0, 24.0, 23.002, 23.003])
+    t = np.arange(4, dtype=np.int64) * 60000
+    mask = aisCleaning.spike_mask(np.zeros(4, dtype=np.int64), t, lon, np.full(4, 37.9), aisCleaning.DEFAULTS)
+    assert mask.tolist() == [False, True, False, False]
@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "run_queries"))
+import crossings
+
+# A gate along the equator, pointing east: north is its left, south its right
+GATE = [[0.0, 0.0], [2.0, 0.0]]
+
+def crossing_sides(points, bucket_index=None):
+    points = np.array(points, dtype=float)
+    bucket_index = np.zeros(len(points), dtype=int) if bucket_index is None else np.array(bucket_index)
+    times = np.arange(len(points), dtype=np.int64) * 60000
+    return [side for _, _, _, _, side in crossings.segment_crossings(bucket_index, times, points[:, 0], points[:, 1], GATE)]
+
+def test_direction_of_a_crossing():
+    assert crossing_sides([[1.0, -0.1], [1.0, 0.1]]) == [1]     # right to left
+    assert crossing_sides([[1.0, 0.1], [1.0, -0.1]]) == [-1]    # left to right
+
+def test_crossing_point_and_time():
+    points = np.array([[1.0, -0.1], [1.0, 0.3]])
+    times = np.array([0, 60000], dtype=np.int64)
+    [(row, time, x, y, side)] = crossings.segment_crossings(np.zeros(2, dtype=int), times, points[:, 0], points[:, 1], GATE)
+    assert row == 0 and time == 15000 and (x, y) == (1.0, 0.0)
+
+def test_fix_on_the_line_is_counted_once_with_its_direction():
+    assert crossing_sides([[1.0, 0.1], [1.0, 0.0], [1.0, -0.1]]) == [-1]
+    assert crossing_sides([[1.0, -0.1], [1.0, 0.0], [1.0, 0.1]]) == [1]
+
+def test_touching_the_line_and_turning_back_is_not_a_crossing():
+    assert crossing_sides([[1.0, 0.1], [1.0, 0.0], [1.1, 0.1]]) == []
+    assert crossing_sides([[1.0, -0.1], [1.0, 0.0], [1.0, 0.0], [1.1, -0.1]]) == []
+
+def test_first_fix_on_the_line_takes_the_side_it_leaves_to():
+    assert crossing_sides([[1.0, 0.0], [1.0, -0.1]]) == [-1]
+
+def test_segments_between_buckets_and_beside_the_gate_do_not_cross():
+    assert crossing_sides([[1.0, -0.1], [1.0, 0.1]], bucket_index=[0, 1]) == []
+    assert crossing_sides([[3.0, -0.1], [3.0, 0.1]]) == []
@@ -0,0 +1,39 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import dynamicParser
+
+def fixes(times, lons):
+    return pd.DataFrame({
+        "vessel_id": "237000001",
+        "timestamp": pd.to_datetime(times),
+        "lon": lons,
+        "lat": 37.9,
+        "speed": 5.0,
+        "heading": 90.0,
+        "course": 90.0,
+    })
+
+def test_consecutive_hours_of_one_file_are_linked():
+    documents = dynamicParser.create_hourly_buckets(fixes(["2017-11-06 08:10", "2017-11-06 08:50", "2017-11-06 09:05"],
+                                                           [23.6, 23.61, 23.62]))
+    assert "previous_fix" not in documents[0]
+    assert documents[1]["previous_fix"]["timestamp"] == pd.Timestamp("2017-11-06 08:50")
+    assert documents[1]["track"]["coordinates"][0] == [23.61, 37.9]
+
+def test_first_bucket_links_to_the_fix_of_an_earlier_file():
+    previous_fixes = {"237000001": {"timestamp": datetime(2017, 11, 6, 8, 55), "coordinates": [23.59, 37.9]}}
+    documents = dynamicParser.create_hourly_buckets(fixes(["2017-11-06 09:05", "2017-11-06 09:20"], [23.6, 23.61]),
+                                                    previous_fixes=previous_fixes)
+    assert documents[0]["previous_fix"] == previous_fixes["237000001"]
+    assert documents[0]["track"]["coordinates"][0] == [23.59, 37.9]
+
+def test_stored_fix_outside_the_previous_hour_is_not_linked():
+    for timestamp in (datetime(2017, 11, 6, 7, 55), datetime(2017, 11, 6, 9, 30)):
+        previous_fixes = {"237000001": {"timestamp": timestamp, "coordinates": [23.59, 37.9]}}
+        documents = dynamicParser.create_hourly_buckets(fixes(["2017-11-06 09:05", "2017-11-06 09:20"], [23.6, 23.61]),
+                                                        previous_fixes=previous_fixes)
+        assert "previous_fix" not in documents[0]
@@ -0,0 +1,95 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "run_queries"))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "load_database"))
+import partitions
+from partition_router import PartitionRouter
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return Cursor(sorted(self, key=lambda doc: doc[field], reverse=direction < 0))
+
+class Catalog:
+    """
+    The partition catalog in memory: evaluates the equality, $gt and $lte filters the router sends.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def matches(self, doc, filter):
+        for field, condition in filter.items():
+            if isinstance(condition, dict):
+                if "$gt" in condition and not doc[field] > condition["$gt"]:
+                    return False
+                if "$lte" in condition and not doc[field] <= condition["$lte"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, filter, projection=None):
+        return Cursor(doc for doc in self.documents if self.matches(doc, filter))
+
+    def count_documents(self, filter, limit=0):
+        return len(self.find(filter))
+
+class Collection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def aggregate(self, pipeline):
+        return iter(self.documents)
+
+class Database(dict):
+    def __getitem__(self, name):
+        return self.setdefault(name, Collection([]))
+
+def catalog_entry(month, state="active", base="dynamic_collection"):
+    start, end = partitions.month_bounds(month)
+    return {"_id": partitions.partition_name(base, month), "base": base, "start": start, "end": end, "state": state}
+
+def router(entries):
+    db = Database()
+    db[partitions.CATALOG] = Catalog(entries)
+    return PartitionRouter(db), db
+
+def test_partition_names_and_month_bounds():
+    assert partitions.partition_name("dynamic_collection", datetime(2017, 11, 6)) == "dynamic_collection_2017_11"
+    assert partitions.month_bounds(datetime(2017, 12, 31, 23)) == (datetime(2017, 12, 1), datetime(2018, 1, 1))
+
+def test_split_by_month_uses_timestamp_start():
+    documents = [{"timestamp_start": datetime(2017, 11, 30, 23)}, {"timestamp_start": datetime(2017, 12, 1)}]
+    months = partitions.split_by_month(documents)
+    assert {month: len(docs) for month, docs in months.items()} == {datetime(2017, 11, 1): 1, datetime(2017, 12, 1): 1}
+
+def test_time_range_is_routed_to_the_overlapping_months_only():
+    months = [datetime(2017, 10, 1), datetime(2017, 11, 1), datetime(2017, 12, 1)]
+    routed, _ = router([catalog_entry(month) for month in months])
+    assert routed.partitions(datetime(2017, 11, 6), datetime(2017, 11, 7)) == ["dynamic_collection_2017_11"]
+    assert routed.partitions(datetime(2017, 11, 30, 23), datetime(2017, 12, 1, 1)) == \
+        ["dynamic_collection_2017_11", "dynamic_collection_2017_12"]
+    # A range ending exactly at a month start still reaches that month's first bucket
+    assert routed.partitions(datetime(2017, 10, 31), datetime(2017, 11, 1)) == \
+        ["dynamic_collection_2017_10", "dynamic_collection_2017_11"]
+    assert len(routed.partitions()) == 3
+
+def test_archived_months_are_skipped():
+    routed, _ = router([catalog_entry(datetime(2017, 10, 1), state="archived"), catalog_entry(datetime(2017, 11, 1))])
+    assert routed.partitions() == ["dynamic_collection_2017_11"]
+    assert routed.partitions(datetime(2017, 10, 2), datetime(2017, 10, 3)) == []
+
+def test_without_partitions_the_base_collection_is_queried():
+    routed, _ = router([])
+    assert routed.partitions(datetime(2017, 11, 6), datetime(2017, 11, 7)) == ["dynamic_collection"]
+
+def test_nearest_merges_the_k_nearest_of_every_partition():
+    routed, db = router([catalog_entry(datetime(2017, 10, 1)), catalog_entry(datetime(2017, 11, 1))])
+    db["dynamic_collection_2017_10"] = Collection([{"_id": "a", "distance": {"calculated": 5.0}},
+                                                   {"_id": "b", "distance": {"calculated": 40.0}}])
+    db["dynamic_collection_2017_11"] = Collection([{"_id": "c", "distance": {"calculated": 1.0}},
+                                                   {"_id": "d", "distance": {"calculated": 20.0}}])
+    nearest = routed.nearest(3, [23.6, 37.9], datetime(2017, 10, 30), datetime(2017, 11, 2))
+    assert [doc["_id"] for doc in nearest] == ["c", "a", "d"]
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "run_queries"))
+from result_cache import ResultCache
+
+def test_entry_survives_writes_to_other_collections():
+    cache = ResultCache()
+    cache.set_generation({"dynamic_collection": 1, "mv_region_hourly_counts": 1})
+    key = cache.key("query3a", point=[23.5, 37.7], radius=5)
+    cache.put(key, [{"vessel_id": "a"}], ["dynamic_collection"])
+    cache.set_generation({"dynamic_collection": 1, "mv_region_hourly_counts": 2, "vessel_latest": 1})
+    assert cache.get(key, ["dynamic_collection"]) == (True, [{"vessel_id": "a"}])
+
+def test_entry_is_a_miss_after_its_collection_changed():
+    cache = ResultCache()
+    cache.set_generation({"dynamic_collection": 1, "geodata_collection": 1})
+    key = cache.key("query3c", fid=1, radius=1000)
+    cache.put(key, [], ["dynamic_collection", "geodata_collection"])
+    cache.set_generation({"dynamic_collection": 1, "geodata_collection": 2})
+    assert cache.get(key, ["dynamic_collection", "geodata_collection"]) == (False, None)
+
+def test_values_are_copied():
+    cache = ResultCache()
+    cache.set_generation({})
+    key = cache.key("query3b", K=10, point=[23.36998, 37.69730])
+    value = [{"vessel_id": "a"}]
+    cache.put(key, value)
+    value.append({"vessel_id": "b"})
+    hit, cached = cache.get(key)
+    cached.append({"vessel_id": "c"})
+    assert cache.get(key) == (True, [{"vessel_id": "a"}])